@@ -0,0 +1,206 @@
+# coding: utf-8
+"""
+Django cache backend keeping values in Elliptics.
+
+For values too large for memcached: rendered fragments, reports. Every value
+is an entity of its own, written and read through EllipticsStorage, so URL
+building, the session pool, retries and the read cache are shared with it.
+
+CACHES = {
+    'elliptics': {
+        'BACKEND': 'django_elliptics.cache.EllipticsCache',
+        'LOCATION': 'cache',  # storage prefix
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'L1_SIZE': 1000,
+            'L1_TIMEOUT': 5,
+        },
+    },
+}
+
+An entity is the expiration time (0 is never, with TIMEOUT 0) on the first
+line followed by the pickled value. Expired entities are left in place to be
+overwritten by the next set(): removing them on read would race with it.
+"""
+import cPickle as pickle
+import hashlib
+import time
+
+from django.core.cache.backends.base import BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+from django_elliptics.storage.cache import LRUCache
+from django_elliptics.storage.errors import ReadError
+from django_elliptics.storage.pool import parallel_map
+
+DEFAULT_STORAGE_CLASS = 'django_elliptics.storage.EllipticsStorage'
+
+
+class EllipticsCache(BaseCache):
+    """
+    OPTIONS:
+        STORAGE_CLASS - dotted path of the storage class.
+        L1_SIZE - number of values kept in process memory, 0 disables it.
+        L1_TIMEOUT - seconds to keep a value in process memory. Other
+            processes do not see each other's L1, keep it short.
+        Any other option in lower case is passed to the storage, e.g.
+        'private_url'.
+    """
+
+    def __init__(self, location, params):
+        super(EllipticsCache, self).__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        storage_class = self._import(
+            options.pop('STORAGE_CLASS', DEFAULT_STORAGE_CLASS)
+        )
+        l1_size = options.pop('L1_SIZE', 1000)
+        l1_timeout = options.pop('L1_TIMEOUT', 5)
+        if location:
+            options.setdefault('prefix', location)
+        self._storage = storage_class(**options)
+        # clear() removes every name under the prefix, it must not be shared
+        prefix = self._storage.settings.prefix
+        if not prefix or prefix == self._storage._get_default('prefix'):
+            raise ImproperlyConfigured(
+                'Elliptics cache needs a prefix of its own in LOCATION, '
+                'not %r' % prefix
+            )
+        self._l1 = LRUCache(l1_size, l1_timeout)
+
+    def _import(self, path):
+        module_name, _, class_name = path.rpartition('.')
+        try:
+            return getattr(import_module(module_name), class_name)
+        except (ImportError, AttributeError, ValueError):
+            raise ImproperlyConfigured(
+                'Elliptics cache storage class %r can not be imported' % path
+            )
+
+    def _name(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        # keys are free text, names are hashes so any key fits into a URL
+        return key, hashlib.md5(key).hexdigest()
+
+    def _timeout(self, timeout):
+        return timeout or self.default_timeout
+
+    def _encode(self, value, timeout):
+        expires = time.time() + timeout if timeout else 0
+        return '%.3f\n%s' % (
+            expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        )
+
+    def _load(self, key, name):
+        """
+        @return: (expires, pickled value) or None if there is no fresh value.
+        """
+        cached = self._l1.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            content = self._storage._fetch(name)
+        except ReadError:
+            return None
+        header, _, data = content.partition('\n')
+        expires = float(header)
+        now = time.time()
+        if expires and expires <= now:
+            return None
+
+        l1_timeout = self._l1.timeout
+        if expires and (l1_timeout is None or expires - now < l1_timeout):
+            l1_timeout = expires - now
+        self._l1.set(key, (expires, data), l1_timeout)
+        return expires, data
+
+    def _store(self, key, name, value, timeout):
+        data = self._encode(value, timeout)
+        self._storage._save(name, data)
+        self._l1.delete(key)
+
+    def add(self, key, value, timeout=None, version=None):
+        """
+        Not atomic: Elliptics has no conditional writes.
+        """
+        if self.has_key(key, version=version):
+            return False
+        self.set(key, value, timeout, version=version)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key, name = self._name(key, version)
+        loaded = self._load(key, name)
+        if loaded is None:
+            return default
+        return pickle.loads(loaded[1])
+
+    def set(self, key, value, timeout=None, version=None):
+        key, name = self._name(key, version)
+        self._store(key, name, value, self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        key, name = self._name(key, version)
+        self._l1.delete(key)
+        self._storage.delete(name)
+
+    def get_many(self, keys, version=None):
+        """
+        Fetch values of the keys in parallel.
+        """
+        names = dict(self._name(key, version) for key in keys)
+        originals = dict(
+            (self.make_key(key, version=version), key) for key in keys
+        )
+        result = {}
+        for key, loaded, exc in parallel_map(
+                lambda key: self._load(key, names[key]), names,
+                self._storage.MAX_PARALLEL_REQUESTS):
+            if exc is not None:
+                raise exc
+            if loaded is not None:
+                result[originals[key]] = pickle.loads(loaded[1])
+        return result
+
+    def set_many(self, data, timeout=None, version=None):
+        """
+        Store the values in parallel.
+        """
+        timeout = self._timeout(timeout)
+        items = [
+            self._name(key, version) + (value,)
+            for key, value in data.iteritems()
+        ]
+        for _, _, exc in parallel_map(
+                lambda item: self._store(item[0], item[1], item[2], timeout),
+                items, self._storage.MAX_PARALLEL_REQUESTS):
+            if exc is not None:
+                raise exc
+
+    def delete_many(self, keys, version=None):
+        names = [self._name(key, version) for key in keys]
+        for key, _ in names:
+            self._l1.delete(key)
+        for _, _, exc in parallel_map(
+                lambda item: self._storage.delete(item[1]), names,
+                self._storage.MAX_PARALLEL_REQUESTS):
+            if exc is not None:
+                raise exc
+
+    def clear(self):
+        """
+        Remove every value, possible only with ELLIPTICS_INDEX_PATH set.
+        """
+        if getattr(self._storage, 'index', None) is None:
+            raise NotImplementedError(
+                'Elliptics can not list keys, set ELLIPTICS_INDEX_PATH'
+            )
+        self._l1.clear()
+        names = [entry[0] for entry in self._storage.scan('')]
+        for _, _, exc in parallel_map(
+                self._storage.delete, names,
+                self._storage.MAX_PARALLEL_REQUESTS):
+            if exc is not None:
+                raise exc
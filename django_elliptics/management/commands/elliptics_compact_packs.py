@@ -0,0 +1,32 @@
+# coding: utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_elliptics.models import STORAGE
+
+
+class Command(BaseCommand):
+    """
+    Rewrite packs of small entities which are mostly deleted.
+    """
+
+    help = 'Compact packs of small Elliptics entities.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--ratio', dest='ratio', type='float', default=0.5,
+            help='Compact packs with this share of live bytes or less.'
+        ),
+        make_option(
+            '--min-age', dest='min_age', type='int', default=3600,
+            help='Leave packs younger than this number of seconds alone.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if STORAGE.packs is None:
+            raise CommandError('ELLIPTICS_PACK_THRESHOLD is not set')
+
+        removed = STORAGE.packs.compact(options['ratio'], options['min_age'])
+        self.stdout.write('%d packs compacted\n' % removed)
@@ -0,0 +1,87 @@
+# coding: utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_elliptics.management.names import (
+    field_names, file_names, model_field
+)
+from django_elliptics.models import STORAGE
+from django_elliptics.storage.errors import ReadError
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the local index of keys (ELLIPTICS_INDEX_PATH).
+
+    Names are taken from model fields and/or a file, every name is checked
+    with a HEAD request in parallel, existing ones are stored in the index.
+    Any failure other than 404 aborts the command and keeps the old index,
+    which would otherwise lose live names.
+    """
+
+    args = '[app_label.Model.field ...]'
+    help = 'Rebuild the local index of Elliptics keys.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--names', dest='names', default=None,
+            help='File with a name per line, "-" for stdin.'
+        ),
+        make_option(
+            '--update', action='store_true', dest='update', default=False,
+            help='Only add found names, keep the rest of the index.'
+        ),
+        make_option(
+            '--batch-size', dest='batch_size', type='int', default=1000,
+            help='Number of names to check at once.'
+        ),
+    )
+
+    def handle(self, *fields, **options):
+        if STORAGE.index is None:
+            raise CommandError('ELLIPTICS_INDEX_PATH is not set')
+        if not fields and not options['names']:
+            raise CommandError('Give model fields or --names')
+
+        try:
+            count = STORAGE.index.rebuild(
+                self._stat(self._names(fields, options['names']),
+                           options['batch_size']),
+                replace=not options['update']
+            )
+        except ReadError as exc:
+            raise CommandError(
+                'Failed to check names, the index is kept: %s' % exc
+            )
+        self.stdout.write('%d keys indexed\n' % count)
+
+    def _names(self, fields, names_path):
+        for field in fields:
+            for name in field_names(*model_field(field)):
+                yield name
+
+        if names_path:
+            for name in file_names(names_path):
+                yield name
+
+    def _stat(self, names, batch_size):
+        checked = 0
+        batch = []
+        for name in names:
+            batch.append(name)
+            if len(batch) < batch_size:
+                continue
+            for entry in self._stat_batch(batch):
+                yield entry
+            checked += len(batch)
+            batch = []
+            self.stdout.write('%d names checked\n' % checked)
+
+        for entry in self._stat_batch(batch):
+            yield entry
+
+    def _stat_batch(self, names):
+        stats = STORAGE.stat_many(set(names))
+        for name, stat in stats.iteritems():
+            yield name, stat.size, stat.modified_time
@@ -0,0 +1,72 @@
+# coding: utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_elliptics.management.names import (
+    field_names, file_names, model_field
+)
+from django_elliptics.models import STORAGE
+
+
+class Command(BaseCommand):
+    """
+    Fill the read cache (ELLIPTICS_READ_CACHE_PATH) before taking traffic.
+
+    Only the read cache on disk is shared with the workers, the in-process
+    metadata cache is warmed up by storage.warm_up() called in the worker.
+
+    Names are taken from model fields (elliptics_id by default) and/or a file.
+    Names of a field are warmed up in its own storage, the rest in the default
+    one.
+    """
+
+    args = '[app_label.Model[.field] ...]'
+    help = 'Warm up Elliptics caches with names from models or a file.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--names', dest='names', default=None,
+            help='File with a name per line, "-" for stdin.'
+        ),
+        make_option(
+            '--rate', dest='rate', type='float', default=None,
+            help='Maximum number of names per second.'
+        ),
+        make_option(
+            '--workers', dest='workers', type='int', default=None,
+            help='Number of parallel requests.'
+        ),
+    )
+
+    def handle(self, *fields, **options):
+        if not fields and not options['names']:
+            raise CommandError('Give models or --names')
+
+        sources = []
+        for spec in fields:
+            model, field_name = model_field(spec, 'elliptics_id')
+            storage = getattr(
+                model._meta.get_field(field_name), 'storage', STORAGE
+            )
+            sources.append((spec, storage, field_names(model, field_name)))
+        if options['names']:
+            sources.append(
+                (options['names'], STORAGE, file_names(options['names']))
+            )
+
+        for source, storage, names in sources:
+            if not hasattr(storage, 'warm_up'):
+                raise CommandError('%s is not in Elliptics' % source)
+            if storage.read_cache is None:
+                raise CommandError(
+                    'ELLIPTICS_READ_CACHE_PATH is not set for %s' % source
+                )
+            result = storage.warm_up(
+                names, rate=options['rate'], workers=options['workers'],
+                progress=self._progress
+            )
+            self.stdout.write('%s: %s\n' % (source, result))
+
+    def _progress(self, result):
+        self.stdout.write('%s\n' % result)
@@ -0,0 +1,48 @@
+# coding: utf-8
+"""
+Sources of names for management commands.
+"""
+import sys
+
+from django.core.management.base import CommandError
+from django.db.models import get_model
+
+
+def model_field(spec, default_field=None):
+    """
+    @param spec: 'app_label.Model.field', or 'app_label.Model' when
+        default_field is given.
+    @return: (model, field name)
+    """
+    parts = spec.split('.')
+    if len(parts) == 2 and default_field:
+        parts.append(default_field)
+    try:
+        app_label, model_name, field_name = parts
+    except ValueError:
+        raise CommandError('%s is not app_label.Model.field' % spec)
+    model = get_model(app_label, model_name)
+    if model is None:
+        raise CommandError('no model %s.%s' % (app_label, model_name))
+    return model, field_name
+
+
+def field_names(model, field_name):
+    """
+    Yield non-empty values of the field of every object.
+    """
+    queryset = model._default_manager.exclude(**{field_name: ''})
+    for name in queryset.values_list(field_name, flat=True).iterator():
+        if name:
+            yield name
+
+
+def file_names(path):
+    """
+    Yield a name per line of the file, "-" is stdin.
+    """
+    stream = sys.stdin if path == '-' else open(path)
+    for line in stream:
+        name = line.strip()
+        if name:
+            yield name
@@ -0,0 +1,40 @@
+# coding: utf-8
+import logging
+
+from django_elliptics.storage import profiling
+from django_elliptics.storage.settings import (
+    ELLIPTICS_PROFILING_SAMPLE_RATE, ELLIPTICS_PROFILING_HEADER,
+    ELLIPTICS_PROFILING_SLOWEST
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EllipticsProfilingMiddleware(object):
+    """
+    Traces Elliptics requests made while handling a request.
+
+    The summary (number of calls, total time, the slowest keys) is logged,
+    and the total time is sent in Server-Timing header. The trace is
+    available as request.elliptics_trace, e.g. for EllipticsPanel.
+
+    Only ELLIPTICS_PROFILING_SAMPLE_RATE of requests are traced.
+    """
+
+    def process_request(self, request):
+        request.elliptics_trace = profiling.start(
+            ELLIPTICS_PROFILING_SAMPLE_RATE
+        )
+
+    def process_response(self, request, response):
+        trace = profiling.stop()
+        if trace is None or not trace.calls:
+            return response
+
+        logger.info(
+            'Elliptics for %s %s: %s', request.method, request.path,
+            trace.summary(ELLIPTICS_PROFILING_SLOWEST)
+        )
+        if ELLIPTICS_PROFILING_HEADER:
+            response['Server-Timing'] = trace.server_timing()
+        return response
@@ -173,3 +173,35 @@ class SerializedPropsMixIn(models.Model):
 
     class Meta:
         abstract = True
+
+
+class EllipticsPack(models.Model):
+    """
+    An Elliptics entity holding many small entities one after another.
+    See django_elliptics.storage.packing.
+    """
+    # storage prefix the pack belongs to
+    namespace = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # bytes of entries which are still referenced
+    live_size = models.BigIntegerField()
+    created = models.FloatField()
+
+    class Meta:
+        unique_together = ('namespace', 'name')
+
+
+class EllipticsPackedEntry(models.Model):
+    """
+    Location of a small entity inside a pack.
+    """
+    namespace = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    pack = models.ForeignKey(EllipticsPack, related_name='entries')
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    modified_time = models.FloatField()
+
+    class Meta:
+        unique_together = ('namespace', 'name')
@@ -0,0 +1,45 @@
+# coding: utf-8
+"""
+Panel for django-debug-toolbar showing Elliptics requests of the page.
+
+Needs EllipticsProfilingMiddleware. Add
+'django_elliptics.panels.EllipticsPanel' to DEBUG_TOOLBAR_PANELS.
+"""
+from django.utils.html import escape
+
+from debug_toolbar.panels import Panel
+
+
+class EllipticsPanel(Panel):
+    title = 'Elliptics'
+
+    @property
+    def nav_subtitle(self):
+        stats = self.get_stats()
+        if not stats.get('calls'):
+            return 'not traced'
+        return '%d calls in %.1f ms' % (
+            len(stats['calls']), stats['duration'] * 1000
+        )
+
+    def generate_stats(self, request, response):
+        trace = getattr(request, 'elliptics_trace', None)
+        if trace is not None:
+            self.record_stats({
+                'calls': trace.calls, 'duration': trace.total_duration,
+            })
+
+    @property
+    def content(self):
+        rows = ''.join(
+            '<tr><td>%s</td><td>%s</td><td>%s</td><td>%d</td><td>%d</td>'
+            '<td>%.1f</td></tr>' % (
+                escape(call.method), escape(call.key), call.status,
+                call.bytes, call.retries, call.duration * 1000)
+            for call in self.get_stats().get('calls', ())
+        )
+        return (
+            '<table><thead><tr><th>Method</th><th>Key</th><th>Status</th>'
+            '<th>Bytes</th><th>Retries</th><th>ms</th></tr></thead>'
+            '<tbody>%s</tbody></table>' % rows
+        )
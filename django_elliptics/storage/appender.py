@@ -0,0 +1,177 @@
+# coding: utf-8
+import logging
+import os
+import threading
+import time
+
+from .errors import *
+
+logger = logging.getLogger(__name__)
+
+
+class _Buffer(object):
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        # time of the oldest part which has not been sent yet
+        self.since = None
+        # error of the last background flush, reported to the next caller
+        self.error = None
+        # flushes of a name go one after another to keep the order
+        self.flush_lock = threading.Lock()
+
+
+class BufferedAppender(object):
+    """
+    Gathers appends to every name and sends them as a single append request.
+
+    A name is flushed when its buffer reaches max_size bytes, when its oldest
+    data is interval seconds old, or on flush() and close(). Appends of a name
+    reach Elliptics in order. Data of a failed flush is kept for the next one.
+    A failure of a flush made by append() or in background is raised by the
+    next append(), flush() or close() of that name. append() raises only
+    before it takes the data, so it is safe to retry.
+
+    with storage.appender() as appender:
+        for line in lines:
+            appender.append('log.txt', line)
+    """
+
+    def __init__(self, storage, max_size, interval):
+        """
+        @param interval: seconds, 0 disables background flushes.
+        """
+        self.storage = storage
+        self.max_size = max_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._closed = False
+        self._pid = None
+
+    def append(self, name, data):
+        """
+        @raise: BaseError
+        """
+        if self._closed:
+            raise BaseError('appender is closed')
+        self._start()
+
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = _Buffer()
+            # raised before the data is taken, so a retry does not repeat it
+            error, buffer.error = buffer.error, None
+            if error is not None:
+                raise error
+            buffer.parts.append(data)
+            buffer.size += len(data)
+            if buffer.since is None:
+                buffer.since = time.time()
+            full = buffer.size >= self.max_size
+
+        if full:
+            try:
+                self._flush(name, buffer)
+            except BaseError as exc:
+                # the data has been taken and is kept for the next flush
+                logger.warning(
+                    'Failed to flush appends to "%s": %s', name, repr(exc)
+                )
+                with self._lock:
+                    buffer.error = exc
+
+    def flush(self, name=None):
+        """
+        Send buffered data of the name, or of every name.
+
+        @raise: BaseError, the first one if several flushes failed.
+        """
+        with self._lock:
+            if name is None:
+                buffers = self._buffers.items()
+            elif name in self._buffers:
+                buffers = [(name, self._buffers[name])]
+            else:
+                buffers = []
+
+        error = None
+        for name, buffer in buffers:
+            try:
+                with self._lock:
+                    buffer_error, buffer.error = buffer.error, None
+                if buffer_error is not None:
+                    raise buffer_error
+                self._flush(name, buffer)
+            except BaseError as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+
+    def close(self):
+        self._closed = True
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _flush(self, name, buffer):
+        with buffer.flush_lock:
+            with self._lock:
+                data = ''.join(buffer.parts)
+                buffer.parts, buffer.size, buffer.since = [], 0, None
+            if not data:
+                return
+
+            try:
+                self.storage._save(name, data, append=True)
+            except BaseError:
+                with self._lock:
+                    # newer parts have been appended after the failed ones
+                    buffer.parts.insert(0, data)
+                    buffer.size += len(data)
+                    buffer.since = time.time()
+                raise
+
+            with self._lock:
+                # an earlier failure is resolved by this flush
+                buffer.error = None
+                if not buffer.parts and self._buffers.get(name) is buffer:
+                    del self._buffers[name]
+
+    def _start(self):
+        """
+        Start the background flusher, again after fork.
+        """
+        if not self.interval or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        thread = threading.Thread(
+            target=self._flush_forever, name='elliptics-appender'
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _flush_forever(self):
+        while not self._closed:
+            time.sleep(self.interval / 2.0)
+            deadline = time.time() - self.interval
+            with self._lock:
+                expired = [
+                    (name, buffer) for name, buffer in self._buffers.items()
+                    if buffer.since is not None and buffer.since <= deadline
+                ]
+
+            for name, buffer in expired:
+                try:
+                    self._flush(name, buffer)
+                except BaseError as exc:
+                    logger.warning(
+                        'Failed to flush appends to "%s": %s', name, repr(exc)
+                    )
+                    with self._lock:
+                        buffer.error = exc
@@ -1,6 +1,9 @@
 # coding: utf-8
+import collections
+import datetime
 import urllib
 from cStringIO import StringIO
+from email.utils import parsedate_tz, mktime_tz
 
 import requests
 from django.core.files import base, storage
@@ -9,6 +12,28 @@ from django import conf
 from .errors import *
 
 
+class ObjectStat(collections.namedtuple(
+        'ObjectStat', 'size modified_time etag')):
+    """
+    Metadata of an entity. Any field may be None if Elliptics did not report it.
+
+    modified_time is a unix timestamp.
+    """
+
+    @classmethod
+    def from_response(cls, response):
+        size = response.headers.get('content-length')
+        modified_time = response.headers.get('last-modified')
+        if modified_time:
+            modified_time = parsedate_tz(modified_time)
+            modified_time = modified_time and mktime_tz(modified_time)
+        return cls(
+            size=int(size) if size is not None else None,
+            modified_time=modified_time or None,
+            etag=response.headers.get('etag'),
+        )
+
+
 class BaseEllipticsStorage(storage.Storage):
     """
     Base Django file storage backend for Elliptics via HTTP API.
@@ -54,13 +79,37 @@ class BaseEllipticsStorage(storage.Storage):
         overwrite the contents with the given name.
         This will save your application from unnecessary request in the storage system.
         """
-        url = self._make_private_url('get', name)
-        r = self.session.head(url)
-        return r.status_code == 200
+        return self._head(name).status_code == 200
+
+    def stat(self, name, fresh=False):
+        """
+        Return ObjectStat of the name, asking Elliptics for headers only.
+
+        @param fresh: do not use cached metadata, always true here.
+        @raise: ReadError
+        """
+        response = self._head(name)
+        if response.status_code != 200:
+            raise ReadError(response)
+        return ObjectStat.from_response(response)
+
+    def size(self, name):
+        return self.stat(name).size
+
+    def modified_time(self, name):
+        modified_time = self.stat(name).modified_time
+        if modified_time is None:
+            raise NotImplementedError(
+                'Elliptics did not report modification time of %s' % name)
+        return datetime.datetime.fromtimestamp(modified_time)
 
     def url(self, name):
         return self._make_public_url('get', name)
 
+    def _head(self, name):
+        url = self._make_private_url('get', name)
+        return self.session.head(url)
+
     def _open(self, name, mode):
         return EllipticsFile(name, self, mode)
 
@@ -164,7 +213,23 @@ class EllipticsFile(base.File):
 
     @property
     def size(self):
-        raise NotImplementedError
+        if self._mode == 'w':
+            return len(self._stream.getvalue()) if self._stream else 0
+
+        if self._mode == 'r' and self._stream is not None:
+            return len(self._stream.getvalue())
+
+        try:
+            size = self._storage.size(self.name)
+        except ReadError as exc:
+            # appends create missing entities
+            missing = isinstance(exc, NotFoundError) or exc.status_code == 404
+            if self._mode != 'a' or not missing:
+                raise
+            size = 0
+        if self._stream is not None:
+            size += len(self._stream.getvalue())
+        return size
 
     @property
     def closed(self):
@@ -0,0 +1,83 @@
+# coding: utf-8
+import collections
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    Thread-safe in-process cache with bounded size and entry lifetime.
+
+    The least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries, timeout=None):
+        """
+        @param max_entries: maximum number of entries, 0 disables the cache.
+        @param timeout: lifetime of an entry in seconds, None means forever.
+        """
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # key -> clock of its last deletion, for the latest max_entries keys
+        self._clock = 0
+        self._deleted = collections.OrderedDict()
+        self._forgotten = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time.time():
+                return default
+            self._entries[key] = expires, value
+            return value
+
+    def stamp(self):
+        """
+        Mark the moment a value starts being loaded, see set().
+        """
+        with self._lock:
+            return self._clock
+
+    def set(self, key, value, timeout=None, stamp=None):
+        """
+        @param stamp: result of stamp() taken before the value was loaded,
+            the value is not stored if the key has been deleted since then.
+        """
+        if not self.max_entries:
+            return
+        if timeout is None:
+            timeout = self.timeout
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            if stamp is not None and (
+                    self._deleted.get(key, 0) > stamp or
+                    self._forgotten > stamp):
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = expires, value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            if not self.max_entries:
+                return
+            self._clock += 1
+            self._deleted.pop(key, None)
+            self._deleted[key] = self._clock
+            while len(self._deleted) > self.max_entries:
+                # loads started before it can not be told apart any more
+                self._forgotten = self._deleted.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
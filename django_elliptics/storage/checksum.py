@@ -0,0 +1,180 @@
+# coding: utf-8
+"""
+Checksums of entities, computed while the content is uploaded.
+
+Elliptics HTTP interface has no place for custom metadata, so checksums are
+kept in a sidecar entity next to the data: name + SIDECAR_SUFFIX. Besides the
+digest of the whole entity the sidecar has a digest of every chunk, so a
+corrupted chunk can be downloaded again alone.
+"""
+import hashlib
+import json
+import zlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+
+
+SIDECAR_SUFFIX = '.checksum'
+
+
+class _CRC(object):
+    def __init__(self, function):
+        self._function = function
+        self._value = 0
+
+    def update(self, data):
+        self._value = self._function(data, self._value)
+
+    def hexdigest(self):
+        return '%08x' % (self._value & 0xffffffff)
+
+
+ALGORITHMS = {
+    'crc32': lambda: _CRC(zlib.crc32),
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+}
+if xxhash is not None:
+    ALGORITHMS['xxhash'] = xxhash.xxh64
+if crc32c is not None:
+    ALGORITHMS['crc32c'] = lambda: _CRC(crc32c.crc32c)
+
+
+def new_digest(algorithm):
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(
+            'unknown checksum algorithm %r, available: %s' % (
+                algorithm, ', '.join(sorted(ALGORITHMS)))
+        )
+
+
+def digest(algorithm, data):
+    result = new_digest(algorithm)
+    result.update(data)
+    return result.hexdigest()
+
+
+class Manifest(object):
+    """
+    Checksums of an entity: of the whole content and of every chunk.
+
+    ETag and modification time of the entity tell whether the manifest still
+    describes it: writers without checksums leave the sidecar as it is.
+    """
+
+    def __init__(self, algorithm, chunk_size, size, digest, chunks,
+                 etag=None, modified_time=None):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.size = size
+        self.digest = digest
+        self.chunks = chunks
+        self.etag = etag
+        self.modified_time = modified_time
+
+    def dumps(self):
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def loads(cls, data):
+        return cls(**json.loads(data))
+
+    def describes(self, stat):
+        """
+        @param stat: ObjectStat of the entity.
+        @return: False if the entity has been written after the manifest.
+        """
+        if self.etag and stat.etag:
+            return self.etag == stat.etag
+        if self.modified_time and stat.modified_time:
+            return self.modified_time == stat.modified_time
+        return True
+
+    def chunk_range(self, index):
+        """
+        @return: (offset, size) of the chunk.
+        """
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def bad_chunks(self, content):
+        """
+        Return indexes of chunks of the content with wrong digests.
+        """
+        return [
+            index for index, expected in enumerate(self.chunks)
+            if digest(self.algorithm, content[
+                index * self.chunk_size:(index + 1) * self.chunk_size
+            ]) != expected
+        ]
+
+    def check_chunk(self, offset, data):
+        """
+        Check a piece of the content if it is a whole chunk.
+
+        @return: False if the piece is a chunk with a wrong digest.
+        """
+        index, remainder = divmod(offset, self.chunk_size)
+        if remainder or index >= len(self.chunks):
+            return True
+        if len(data) != self.chunk_range(index)[1]:
+            return True
+        return digest(self.algorithm, data) == self.chunks[index]
+
+
+class ChecksumReader(object):
+    """
+    File-like wrapper of the content computing checksums of what is read.
+
+    @param create_chunk: callable(content, from_byte, chunk_length)
+    """
+
+    def __init__(self, content, size, algorithm, chunk_size, create_chunk):
+        self.size = size
+        self._content = content
+        self._create_chunk = create_chunk
+        self._offset = 0
+        self._algorithm = algorithm
+        self._chunk_size = chunk_size
+        self._digest = new_digest(algorithm)
+        self._chunk_digest = new_digest(algorithm)
+        self._chunk_left = chunk_size
+        self._chunks = []
+
+    def read(self, num_bytes):
+        data = self._create_chunk(self._content, self._offset, num_bytes)
+        self._offset += len(data)
+        self._digest.update(data)
+
+        rest = data
+        while rest:
+            piece, rest = rest[:self._chunk_left], rest[self._chunk_left:]
+            self._chunk_digest.update(piece)
+            self._chunk_left -= len(piece)
+            if not self._chunk_left:
+                self._finish_chunk()
+        return data
+
+    def _finish_chunk(self):
+        self._chunks.append(self._chunk_digest.hexdigest())
+        self._chunk_digest = new_digest(self._algorithm)
+        self._chunk_left = self._chunk_size
+
+    def manifest(self):
+        if self._chunk_left != self._chunk_size:
+            self._finish_chunk()
+        return Manifest(
+            self._algorithm, self._chunk_size, self._offset,
+            self._digest.hexdigest(), self._chunks
+        )
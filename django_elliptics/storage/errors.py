@@ -12,6 +12,11 @@ class ModeError (BaseError):
 class HTTPError(BaseError):
     """Elliptics request failed."""
 
+    @property
+    def status_code(self):
+        """Status code of the response, None if there was no response."""
+        return getattr(self.args[0], 'status_code', None)
+
 
 class SaveError(HTTPError):
     """Failed to store file to the backend."""
@@ -39,3 +44,21 @@ class TimeoutError(ReadError, SaveError):
     # with a response, therefore overriding is introduced again.
     def __str__(self):
         return super(HTTPError, self).__str__()
+
+
+class NotFoundError(ReadError):
+    """The entity is known to be absent without asking the backend."""
+
+    def __str__(self):
+        return super(HTTPError, self).__str__()
+
+
+class ChecksumError(ReadError):
+    """Content read from the backend does not match its checksum."""
+
+    def __str__(self):
+        return super(HTTPError, self).__str__()
+
+
+class JournalError(BaseError):
+    """Local write journal can not be used."""
@@ -0,0 +1,68 @@
+# coding: utf-8
+import threading
+import time
+
+
+class _GroupStats(object):
+    def __init__(self):
+        # moving averages, latency is None until the first success
+        self.latency = None
+        self.error_rate = 0.0
+        self.failed_at = 0
+
+
+class GroupSelector(object):
+    """
+    Orders replica groups for reads: the fastest healthy ones first.
+
+    Latency and error rate of every group are exponential moving averages
+    of reported requests. A group with error rate above error_threshold is
+    unhealthy for cooldown seconds after its last failure, such groups are
+    tried last. Groups without successful requests yet are tried first, so
+    every group gets measured.
+    """
+
+    def __init__(self, groups, error_threshold=0.5, cooldown=30, weight=0.2):
+        self.groups = list(groups)
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.weight = weight
+        self._stats = dict((group, _GroupStats()) for group in self.groups)
+        self._lock = threading.Lock()
+
+    def order(self):
+        now = time.time()
+        healthy, unhealthy = [], []
+        with self._lock:
+            for group in self.groups:
+                stats = self._stats[group]
+                if (stats.error_rate > self.error_threshold and
+                        now - stats.failed_at < self.cooldown):
+                    unhealthy.append((stats.failed_at, group))
+                else:
+                    healthy.append((stats.latency or 0, group))
+
+        return [group for _, group in sorted(healthy) + sorted(unhealthy)]
+
+    def report(self, group, duration, success):
+        with self._lock:
+            stats = self._stats[group]
+            stats.error_rate += self.weight * (
+                (0.0 if success else 1.0) - stats.error_rate
+            )
+            if not success:
+                stats.failed_at = time.time()
+            elif stats.latency is None:
+                stats.latency = duration
+            else:
+                stats.latency += self.weight * (duration - stats.latency)
+
+    def stats(self):
+        """
+        @return: {group: (latency, error rate)}
+        """
+        with self._lock:
+            return dict(
+                (group, (stats.latency, stats.error_rate))
+                for group, stats in self._stats.iteritems()
+            )
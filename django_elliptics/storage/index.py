@@ -0,0 +1,205 @@
+# coding: utf-8
+"""
+Local index of keys stored in Elliptics.
+
+Elliptics can not enumerate keys cheaply, so the storage records every
+write and deletion in a SQLite database: name, size and modification time.
+The database may be shared by processes of a host.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS elliptics_keys (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    modified_time REAL,
+    PRIMARY KEY (namespace, name)
+)
+'''
+
+
+def _text(value):
+    """
+    sqlite3 refuses non-ASCII byte strings, names are stored as unicode.
+    """
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+
+def _prefix_bound(prefix):
+    """
+    Return the smallest string greater than every string with the prefix.
+    """
+    prefix = _text(prefix)
+    return prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+
+
+class KeyIndex(object):
+    """
+    SQLite index of names, their sizes and modification times.
+
+    @param namespace: keeps names of storages with different prefixes apart.
+    """
+
+    def __init__(self, path, namespace=''):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """
+        Connection of the current thread, sqlite3 does not share them.
+        """
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(SCHEMA)
+            connection.commit()
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def update(self, name, size, modified_time):
+        with self.connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO elliptics_keys VALUES (?, ?, ?, ?)',
+                (self.namespace, _text(name), size, modified_time)
+            )
+
+    def append(self, name, size, modified_time):
+        """
+        Grow the size of the name, the entity is created if it is missing.
+        """
+        with self.connection as connection:
+            connection.execute(
+                'INSERT OR IGNORE INTO elliptics_keys VALUES (?, ?, 0, ?)',
+                (self.namespace, _text(name), modified_time)
+            )
+            connection.execute(
+                'UPDATE elliptics_keys SET size = size + ?, modified_time = ? '
+                'WHERE namespace = ? AND name = ?',
+                (size, modified_time, self.namespace, _text(name))
+            )
+
+    def remove(self, name):
+        with self.connection as connection:
+            connection.execute(
+                'DELETE FROM elliptics_keys WHERE namespace = ? AND name = ?',
+                (self.namespace, _text(name))
+            )
+
+    def get(self, name):
+        """
+        @return: (size, modified_time) or None.
+        """
+        return self.connection.execute(
+            'SELECT size, modified_time FROM elliptics_keys '
+            'WHERE namespace = ? AND name = ?',
+            (self.namespace, _text(name))
+        ).fetchone()
+
+    def scan(self, prefix='', start=None, stop=None, limit=None):
+        """
+        Iterate over (name, size, modified_time) in the order of names.
+
+        @param prefix: only names starting with the prefix.
+        @param start: only names greater or equal to start.
+        @param stop: only names less than stop.
+        """
+        conditions = ['namespace = ?']
+        params = [self.namespace]
+        if prefix:
+            conditions.append('name >= ? AND name < ?')
+            params.extend((_text(prefix), _prefix_bound(prefix)))
+        if start is not None:
+            conditions.append('name >= ?')
+            params.append(_text(start))
+        if stop is not None:
+            conditions.append('name < ?')
+            params.append(_text(stop))
+
+        query = (
+            'SELECT name, size, modified_time FROM elliptics_keys '
+            'WHERE %s ORDER BY name' % ' AND '.join(conditions)
+        )
+        if limit is not None:
+            query += ' LIMIT %d' % limit
+        return self.connection.execute(query, params)
+
+    def listdir(self, path):
+        """
+        @return: (directories, files) right under the path.
+        """
+        prefix = _text(path).strip('/')
+        if prefix:
+            prefix += '/'
+
+        directories, files = set(), []
+        for name, _, _ in self.scan(prefix):
+            rest = name[len(prefix):]
+            if '/' in rest:
+                directories.add(rest.split('/', 1)[0])
+            else:
+                files.append(rest)
+        return sorted(directories), files
+
+    def rebuild(self, entries, replace=True, batch_size=1000):
+        """
+        Store (name, size, modified_time) entries in bulk.
+
+        Entries are written into a staging namespace in batches, so a slow
+        producer does not lock the database, and replace the namespace at once.
+
+        @param replace: forget every name missing from the entries.
+        @return: number of entries stored.
+        """
+        staging = self.namespace + '\x01rebuild'
+        with self.connection as connection:
+            connection.execute(
+                'DELETE FROM elliptics_keys WHERE namespace = ?', (staging,)
+            )
+
+        count = 0
+        batch = []
+        for name, size, modified_time in entries:
+            batch.append((staging, name, size, modified_time))
+            if len(batch) >= batch_size:
+                count += self._insert(batch)
+                batch = []
+        count += self._insert(batch)
+
+        with self.connection as connection:
+            if replace:
+                connection.execute(
+                    'DELETE FROM elliptics_keys WHERE namespace = ?',
+                    (self.namespace,)
+                )
+            else:
+                connection.execute(
+                    'DELETE FROM elliptics_keys WHERE namespace = ? AND name IN '
+                    '(SELECT name FROM elliptics_keys WHERE namespace = ?)',
+                    (self.namespace, staging)
+                )
+            connection.execute(
+                'UPDATE elliptics_keys SET namespace = ? WHERE namespace = ?',
+                (self.namespace, staging)
+            )
+        logger.info('Stored %d keys in the index %s', count, self.path)
+        return count
+
+    def _insert(self, rows):
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO elliptics_keys VALUES (?, ?, ?, ?)', rows
+            )
+        return len(rows)
@@ -0,0 +1,646 @@
+# coding: utf-8
+"""
+Local durable write journal.
+
+Writes are appended to a local file and fsynced, so the caller gets an
+acknowledgement bounded by the local disk. A background thread replays the
+journal into Elliptics in the order the writes were made. Until a write is
+replayed, reads of its key are served from the journal.
+
+Every storage instance owns its own segment file, locked with flock(2).
+Segments left by dead processes are not locked by anyone, they are adopted
+and replayed by the first journal which finds them. A segment growing above
+segment_size is rotated: a new one is started and the old one is removed
+once replayed.
+
+Pending writes are visible only to the process which has made them, other
+processes see the old content until the replay.
+
+A write failing max_retries times in a row, or rejected by Elliptics with
+a 4xx status, is moved aside into the rejected directory, so it does not
+hold the writes after it. Such a file has the operation and the name on its
+first line, the content after it.
+"""
+import collections
+import contextlib
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+
+from .base import ObjectStat
+from .errors import *
+
+logger = logging.getLogger(__name__)
+
+
+OP_WRITE = 0
+OP_APPEND = 1
+OP_DELETE = 2
+
+# operation, timestamp, length of the name
+RECORD_HEADER = struct.Struct('!BdH')
+# length of a frame of content, zero-length frame ends the record
+FRAME_HEADER = struct.Struct('!I')
+
+SEGMENT_SUFFIX = '.journal'
+POSITION_SUFFIX = '.pos'
+REJECTED_DIR = 'rejected'
+
+OPERATION_NAMES = {OP_WRITE: 'write', OP_APPEND: 'append', OP_DELETE: 'delete'}
+
+
+class JournalRecord(object):
+    """
+    A single operation kept in a segment.
+    """
+
+    def __init__(self, segment, operation, timestamp, name, data_offset,
+                 length, end):
+        self.segment = segment
+        self.operation = operation
+        self.timestamp = timestamp
+        self.name = name
+        self.data_offset = data_offset
+        self.length = length
+        # offset of the next record in the segment
+        self.end = end
+
+    def open(self):
+        return JournalRecordReader(self)
+
+    def read(self):
+        return self.open().read()
+
+
+class JournalRecordReader(object):
+    """
+    File-like object reading the content of a record.
+
+    Has the size attribute, so it is uploaded as an entity of known size.
+    """
+
+    def __init__(self, record):
+        self.size = record.length
+        self._file = open(record.segment.path, 'rb')
+        self._file.seek(record.data_offset)
+        self._frame_left = 0
+        self._exhausted = False
+
+    def read(self, num_bytes=None):
+        parts = []
+        while not self._exhausted and (num_bytes is None or num_bytes > 0):
+            if not self._frame_left:
+                header = self._file.read(FRAME_HEADER.size)
+                self._frame_left, = FRAME_HEADER.unpack(header)
+                if not self._frame_left:
+                    self._exhausted = True
+                    self._file.close()
+                    break
+
+            to_read = self._frame_left
+            if num_bytes is not None:
+                to_read = min(to_read, num_bytes)
+                num_bytes -= to_read
+            parts.append(self._file.read(to_read))
+            self._frame_left -= to_read
+
+        return ''.join(parts)
+
+
+class JournalSegment(object):
+    """
+    An append-only file with records, locked by its owner.
+    """
+
+    def __init__(self, path, owned):
+        self.path = path
+        self.owned = owned
+        self.file = open(path, 'ab+')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as exc:
+            self.file.close()
+            if exc.errno in (errno.EAGAIN, errno.EACCES):
+                raise JournalError('segment %s is locked' % path)
+            raise
+
+    @property
+    def size(self):
+        return os.fstat(self.file.fileno()).st_size
+
+    @property
+    def position_path(self):
+        return self.path + POSITION_SUFFIX
+
+    def read_position(self):
+        try:
+            with open(self.position_path, 'rb') as stream:
+                return int(stream.read() or 0)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return 0
+
+    def write_position(self, position):
+        temp_path = self.position_path + '.tmp'
+        with open(temp_path, 'wb') as stream:
+            stream.write(str(position))
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.rename(temp_path, self.position_path)
+
+    def append(self, operation, name, content, chunk_size, create_chunk):
+        """
+        Append a record and fsync it.
+
+        @param create_chunk: callable(content, from_byte, chunk_length)
+        @rtype: JournalRecord
+        """
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self.file.seek(0, os.SEEK_END)
+        start = self.file.tell()
+        timestamp = time.time()
+        self.file.write(RECORD_HEADER.pack(operation, timestamp, len(name)))
+        self.file.write(name)
+        data_offset = self.file.tell()
+
+        length = 0
+        try:
+            while content is not None:
+                chunk = create_chunk(content, length, chunk_size)
+                if not chunk:
+                    break
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode('utf-8')
+                self.file.write(FRAME_HEADER.pack(len(chunk)))
+                self.file.write(chunk)
+                length += len(chunk)
+            self.file.write(FRAME_HEADER.pack(0))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except Exception:
+            # do not leave a half-written record behind
+            self.file.truncate(start)
+            raise
+
+        return JournalRecord(
+            self, operation, timestamp, name.decode('utf-8'), data_offset,
+            length, self.file.tell()
+        )
+
+    def scan(self, position):
+        """
+        Return records stored after the position.
+
+        A truncated record at the end (left by a crash) is ignored.
+        """
+        records = []
+        with open(self.path, 'rb') as stream:
+            stream.seek(position)
+            while True:
+                header = stream.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                operation, timestamp, name_length = RECORD_HEADER.unpack(header)
+                name = stream.read(name_length)
+                data_offset = stream.tell()
+                length = 0
+                while True:
+                    frame = stream.read(FRAME_HEADER.size)
+                    if len(frame) < FRAME_HEADER.size:
+                        return records
+                    frame_length, = FRAME_HEADER.unpack(frame)
+                    if not frame_length:
+                        break
+                    stream.seek(frame_length, os.SEEK_CUR)
+                    length += frame_length
+                end = stream.tell()
+                if end > os.fstat(stream.fileno()).st_size:
+                    break
+                records.append(JournalRecord(
+                    self, operation, timestamp, name.decode('utf-8'),
+                    data_offset, length, end
+                ))
+        return records
+
+    def reset(self):
+        self.file.truncate(0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.write_position(0)
+
+    def remove(self):
+        for path in (self.position_path, self.path):
+            try:
+                os.unlink(path)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+        self.file.close()
+
+
+class WriteJournal(object):
+    """
+    Journal of writes waiting to be sent to Elliptics.
+
+    The storage is expected to provide _store, _delete and _fetch_remote
+    methods, which talk to Elliptics directly.
+    """
+
+    # seconds between looking for segments of dead processes
+    SCAN_INTERVAL = 60
+
+    def __init__(self, storage, path, retry_delay, max_retries=10,
+                 segment_size=64 * 1024 * 1024):
+        self.storage = storage
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.segment_size = segment_size
+        # segments of storages with different prefixes must never mix
+        namespace = hashlib.md5('%s|%s' % (
+            storage.settings.private_url, storage.settings.prefix
+        )).hexdigest()[:12]
+        self.path = os.path.join(path, namespace)
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        """
+        Open own segment and start the replayer.
+
+        Done lazily and again after fork, so workers never share a segment.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._init()
+
+    def _init(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # notified when a name stops being replayed or read
+        self._idle = threading.Condition(self._lock)
+        # name -> records not replayed yet
+        self._pending = {}
+        self._queue = collections.deque()
+        self._segments = []
+        # name -> number of readers building it on top of the remote content
+        self._readers = {}
+        self._replaying = None
+        # number of readers of records, segments are not reset meanwhile
+        self._record_readers = 0
+
+        try:
+            os.makedirs(self.path)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        self._segment = JournalSegment(os.path.join(
+            self.path, uuid.uuid4().hex + SEGMENT_SUFFIX
+        ), owned=True)
+        self._adopt_segments()
+
+        self._pid = os.getpid()
+        thread = threading.Thread(
+            target=self._replay_forever, name='elliptics-journal-replayer'
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _adopt_segments(self):
+        """
+        Queue records of segments left by processes that are gone.
+        """
+        adopted = set(segment.path for segment in self._segments)
+        adopted.add(self._segment.path)
+
+        for filename in sorted(os.listdir(self.path)):
+            path = os.path.join(self.path, filename)
+            if not filename.endswith(SEGMENT_SUFFIX) or path in adopted:
+                continue
+            try:
+                segment = JournalSegment(path, owned=False)
+            except (JournalError, IOError):
+                continue
+
+            records = segment.scan(segment.read_position())
+            logger.info(
+                'Adopted journal segment %s with %d records to replay',
+                path, len(records)
+            )
+            with self._lock:
+                self._segments.append(segment)
+                for record in records:
+                    self._enqueue(record)
+                # the end of the segment is marked by the segment itself
+                self._queue.append(segment)
+                self._wakeup.notify()
+
+    def _enqueue(self, record):
+        self._queue.append(record)
+        self._pending.setdefault(record.name, []).append(record)
+
+    def write(self, name, content, append=False):
+        self._start()
+        operation = OP_APPEND if append else OP_WRITE
+        with self._lock:
+            if self._segment.size >= self.segment_size:
+                self._rotate()
+            record = self._segment.append(
+                operation, name, content,
+                self.storage.MAX_CHUNK_SIZE, self.storage._create_chunk
+            )
+            self._enqueue(record)
+            self._wakeup.notify()
+        return record
+
+    def _rotate(self):
+        """
+        Start a new segment, the current one is removed once replayed.
+        """
+        segment = self._segment
+        segment.owned = False
+        self._segments.append(segment)
+        self._queue.append(segment)
+        self._segment = JournalSegment(os.path.join(
+            self.path, uuid.uuid4().hex + SEGMENT_SUFFIX
+        ), owned=True)
+        logger.info(
+            'Journal segment %s is rotated at %d bytes',
+            segment.path, segment.size
+        )
+
+    def delete(self, name):
+        """
+        Journal the deletion if the name has writes waiting for replay.
+
+        @return: True if the deletion has been journaled.
+        """
+        self._start()
+        with self._lock:
+            if not self._pending.get(name):
+                return False
+            record = self._segment.append(
+                OP_DELETE, name, None,
+                self.storage.MAX_CHUNK_SIZE, self.storage._create_chunk
+            )
+            self._enqueue(record)
+            self._wakeup.notify()
+        return True
+
+    def records(self, name):
+        """
+        Return the records of the name waiting for replay.
+
+        Records before the last write or deletion do not matter for reads.
+        """
+        self._start()
+        with self._lock:
+            records = list(self._pending.get(name, ()))
+        for index in xrange(len(records) - 1, -1, -1):
+            if records[index].operation != OP_APPEND:
+                return records[index:]
+        return records
+
+    def exists(self, name):
+        """
+        @return: None if the journal knows nothing about the name.
+        """
+        records = self.records(name)
+        if not records:
+            return None
+        return not (len(records) == 1 and records[0].operation == OP_DELETE)
+
+    def stat(self, name):
+        """
+        Return ObjectStat of the name as it will be after the replay.
+
+        @return: None if the journal knows nothing about the name.
+        @raise: NotFoundError
+        """
+        records = self.records(name)
+        if not records:
+            return None
+
+        if records[0].operation == OP_DELETE and len(records) == 1:
+            raise NotFoundError('%s is deleted' % name)
+
+        size = 0
+        if records[0].operation == OP_APPEND:
+            with self._reading(name, base=True):
+                records = self.records(name)
+                if not records:
+                    return None
+                if records[0].operation == OP_APPEND:
+                    size = self._remote_size(name)
+
+        if size is not None:
+            size += sum(record.length for record in records)
+        return ObjectStat(
+            size=size, modified_time=records[-1].timestamp, etag=None
+        )
+
+    def read(self, name):
+        """
+        Return the content of the name as it will be after the replay.
+
+        @return: None if the journal knows nothing about the name.
+        @raise: NotFoundError
+        """
+        while True:
+            records = self.records(name)
+            if not records:
+                return None
+            base = records[0].operation == OP_APPEND
+
+            with self._reading(name, base):
+                records = self.records(name)
+                if records and (records[0].operation == OP_APPEND) != base:
+                    continue
+                if not records:
+                    return None
+                if records[0].operation == OP_DELETE and len(records) == 1:
+                    raise NotFoundError('%s is deleted' % name)
+
+                parts = [self._remote_content(name)] if base else []
+                parts.extend(record.read() for record in records)
+                return ''.join(parts)
+
+    @contextlib.contextmanager
+    def _reading(self, name, base=False):
+        """
+        Keep records being read from being overwritten.
+
+        @param base: the content is built on top of the remote one, records
+            of the name are not replayed meanwhile, otherwise an append would
+            be counted twice. Replay of other names goes on.
+        """
+        with self._lock:
+            if base:
+                while self._replaying == name:
+                    self._idle.wait()
+                self._readers[name] = self._readers.get(name, 0) + 1
+            self._record_readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if base:
+                    self._readers[name] -= 1
+                    if not self._readers[name]:
+                        del self._readers[name]
+                self._record_readers -= 1
+                self._idle.notify_all()
+
+    def _remote_size(self, name):
+        # appends create missing entities
+        try:
+            return self.storage._stat_remote(name).size
+        except ReadError as exc:
+            if exc.status_code != 404:
+                raise
+            return 0
+
+    def _remote_content(self, name):
+        try:
+            return self.storage._fetch_remote(name)
+        except ReadError as exc:
+            if exc.status_code != 404:
+                raise
+            return ''
+
+    def _replay_forever(self):
+        last_scan = time.time()
+        # the head record and the number of its failures in a row
+        failed, failures = None, 0
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wakeup.wait(self.SCAN_INTERVAL)
+                    if time.time() - last_scan > self.SCAN_INTERVAL:
+                        break
+                item = self._queue[0] if self._queue else None
+
+            if item is None:
+                last_scan = time.time()
+                self._adopt_segments()
+                continue
+
+            if isinstance(item, JournalSegment):
+                self._release(item)
+                continue
+
+            try:
+                self._replay(item, self._send)
+                failures = 0
+            except Exception as exc:
+                failures = failures + 1 if item is failed else 1
+                failed = item
+                if failures < self.max_retries and not self._rejected(exc):
+                    logger.warning(
+                        'Failed to replay "%s" from the journal, retry in %s '
+                        'seconds: %s', item.name, self.retry_delay, repr(exc)
+                    )
+                    time.sleep(self.retry_delay)
+                    continue
+
+                logger.error(
+                    'Failed to replay "%s" from the journal %d times, moving '
+                    'it aside: %s', item.name, failures, repr(exc)
+                )
+                try:
+                    self._replay(item, self._move_aside)
+                except Exception as exc:
+                    logger.error(
+                        'Failed to move "%s" aside, retry in %s seconds: %s',
+                        item.name, self.retry_delay, repr(exc)
+                    )
+                    time.sleep(self.retry_delay)
+
+    def _rejected(self, exc):
+        """
+        Tell errors which will not go away on retries.
+        """
+        status_code = getattr(exc, 'status_code', None)
+        return (status_code is not None and 400 <= status_code < 500 and
+                status_code not in (408, 429))
+
+    def _replay(self, record, send):
+        with self._lock:
+            while self._readers.get(record.name):
+                self._idle.wait()
+            self._replaying = record.name
+        try:
+            send(record)
+            self._done(record)
+        finally:
+            with self._lock:
+                self._replaying = None
+                self._idle.notify_all()
+
+    def _send(self, record):
+        if record.operation == OP_WRITE:
+            self.storage._store(record.name, record.open())
+        elif record.operation == OP_APPEND:
+            self.storage._store(record.name, record.read(), append=True)
+        else:
+            self.storage._delete(record.name)
+
+    def _move_aside(self, record):
+        directory = os.path.join(self.path, REJECTED_DIR)
+        try:
+            os.makedirs(directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        path = os.path.join(directory, '%d-%s' % (
+            record.timestamp, uuid.uuid4().hex
+        ))
+        reader = record.open()
+        with open(path, 'wb') as stream:
+            stream.write('%s %s\n' % (
+                OPERATION_NAMES[record.operation], record.name.encode('utf-8')
+            ))
+            while True:
+                chunk = reader.read(self.storage.MAX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stream.write(chunk)
+            stream.flush()
+            os.fsync(stream.fileno())
+        logger.error('Journaled "%s" is moved to %s', record.name, path)
+
+    def _done(self, record):
+        with self._lock:
+            self._queue.popleft()
+            records = self._pending[record.name]
+            records.remove(record)
+            if not records:
+                del self._pending[record.name]
+
+            if (record.segment.owned and not self._queue and
+                    not self._record_readers):
+                # everything is in Elliptics, start the segment over
+                record.segment.reset()
+                return
+
+        record.segment.write_position(record.end)
+
+    def _release(self, segment):
+        logger.info('Journal segment %s has been replayed', segment.path)
+        with self._lock:
+            while self._record_readers:
+                self._idle.wait()
+            self._queue.popleft()
+            self._segments.remove(segment)
+        segment.remove()
@@ -0,0 +1,345 @@
+# coding: utf-8
+"""
+Packing of small entities into shared blobs.
+
+Every small entity costs a request and a record in Elliptics. Packed, they
+are written as a single pack entity, one after another, and read back with
+offset/size requests. Locations are kept in the database (EllipticsPack,
+EllipticsPackedEntry models), so every host of the project sees them.
+
+Concurrent writers are grouped: the first one waits up to `delay` seconds
+for others (or until the pack is full) and uploads the pack for all of them.
+Everybody returns only after the pack is in Elliptics and in the database.
+Writers inside a database transaction are not grouped: their locations are
+a part of their own transaction only.
+"""
+import contextlib
+import logging
+import threading
+import time
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .base import ObjectStat
+from .errors import *
+
+logger = logging.getLogger(__name__)
+
+PACK_PREFIX = '.packs/'
+
+if hasattr(transaction, 'atomic'):
+    atomic = transaction.atomic
+
+    def in_transaction():
+        return transaction.get_connection().in_atomic_block
+else:
+    def in_transaction():
+        return transaction.is_managed()
+
+    @contextlib.contextmanager
+    def atomic():
+        """
+        transaction.atomic of Django 1.6+.
+
+        commit_on_success would commit or roll back an enclosing transaction,
+        a savepoint is used inside one instead.
+        """
+        if not transaction.is_managed():
+            with transaction.commit_on_success():
+                yield
+            return
+
+        savepoint = transaction.savepoint()
+        try:
+            yield
+        except Exception:
+            transaction.savepoint_rollback(savepoint)
+            raise
+        transaction.savepoint_commit(savepoint)
+
+
+def _models():
+    # models instantiate the storage on import, so they are imported lazily
+    from django_elliptics import models
+    return models
+
+
+class _Batch(object):
+    def __init__(self):
+        self.entries = []
+        self.size = 0
+        self.done = threading.Event()
+        self.error = None
+
+    def add(self, name, data):
+        self.entries.append((name, data))
+        self.size += len(data)
+
+
+class PackedStore(object):
+    """
+    @param threshold: entities up to this size are packed.
+    @param pack_size: a pack is uploaded as soon as it is this large.
+    @param delay: seconds to wait for other writers.
+    """
+
+    def __init__(self, storage, threshold, pack_size, delay):
+        self.storage = storage
+        self.namespace = storage.settings.prefix
+        self.threshold = threshold
+        self.pack_size = pack_size
+        self.delay = delay
+        self._batch = None
+        self._lock = threading.Lock()
+        self._sealed = threading.Condition(self._lock)
+
+    def accepts(self, name, length):
+        return (length is not None and length <= self.threshold and
+                not name.startswith(PACK_PREFIX))
+
+    def put(self, name, data):
+        """
+        Store the data as a packed entity.
+
+        @raise: BaseError
+        """
+        if in_transaction():
+            # nobody else's data may depend on the caller's transaction
+            self.put_many([(name, data)])
+            return
+
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.add(name, data)
+            if batch.size >= self.pack_size:
+                self._batch = None
+                self._sealed.notify_all()
+
+        if leader:
+            deadline = time.time() + self.delay
+            with self._lock:
+                while self._batch is batch and time.time() < deadline:
+                    self._sealed.wait(deadline - time.time())
+                if self._batch is batch:
+                    self._batch = None
+            self._write(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+    def put_many(self, items):
+        """
+        Store (name, data) items in a single pack right away.
+        """
+        batch = _Batch()
+        for name, data in items:
+            batch.add(name, data)
+        self._write(batch)
+        if batch.error is not None:
+            raise batch.error
+
+    def _write(self, batch):
+        try:
+            if batch.entries:
+                self._write_pack(batch.entries)
+        except Exception as exc:
+            batch.error = exc
+        finally:
+            batch.done.set()
+
+    def _write_pack(self, entries, replaced_pack=None):
+        """
+        Upload entries as a new pack and point them to it.
+
+        @param replaced_pack: when compacting, entries are moved only if they
+            still are in this pack.
+        @return: the new pack.
+        """
+        models = _models()
+        pack_name = PACK_PREFIX + uuid.uuid4().hex
+        blob = ''.join(data for _, data in entries)
+        self.storage._store(pack_name, blob)
+        logger.debug(
+            'Packed %d entities into "%s", %d bytes',
+            len(entries), pack_name, len(blob)
+        )
+
+        # a name may be written several times in a batch, the last one wins
+        locations = {}
+        offset = 0
+        for name, data in entries:
+            locations[name] = offset, len(data)
+            offset += len(data)
+
+        now = time.time()
+        for attempt in (1, 2):
+            try:
+                with atomic():
+                    pack = models.EllipticsPack.objects.create(
+                        namespace=self.namespace, name=pack_name,
+                        size=len(blob), live_size=0, created=now
+                    )
+                    moved = self._move_entries(pack, locations, replaced_pack)
+                    models.EllipticsPack.objects.filter(pk=pack.pk).update(
+                        live_size=sum(locations[name][1] for name in moved)
+                    )
+                break
+            except IntegrityError:
+                # somebody has written one of the names at the same moment
+                if attempt == 2:
+                    raise
+        return pack
+
+    def _move_entries(self, pack, locations, replaced_pack):
+        models = _models()
+        old_entries = models.EllipticsPackedEntry.objects.filter(
+            namespace=self.namespace, name__in=locations.keys()
+        )
+        if replaced_pack is not None:
+            old_entries = old_entries.filter(pack=replaced_pack)
+
+        moved = set()
+        for entry in old_entries:
+            models.EllipticsPack.objects.filter(pk=entry.pack_id).update(
+                live_size=F('live_size') - entry.length
+            )
+            moved.add(entry.name)
+        old_entries.delete()
+
+        if replaced_pack is None:
+            moved = set(locations)
+        modified_time = time.time()
+        models.EllipticsPackedEntry.objects.bulk_create([
+            models.EllipticsPackedEntry(
+                namespace=self.namespace, name=name, pack=pack,
+                offset=locations[name][0], length=locations[name][1],
+                modified_time=modified_time
+            )
+            for name in moved
+        ])
+        return moved
+
+    def _entry(self, name):
+        if name.startswith(PACK_PREFIX):
+            # packs are never packed themselves
+            return None
+        models = _models()
+        try:
+            return models.EllipticsPackedEntry.objects.select_related(
+                'pack').get(namespace=self.namespace, name=name)
+        except models.EllipticsPackedEntry.DoesNotExist:
+            return None
+
+    def get(self, name):
+        """
+        @return: content or None if the name is not packed.
+        """
+        entry = self._entry(name)
+        while entry is not None:
+            if not entry.length:
+                return ''
+            try:
+                return self.storage._fetch_range(
+                    entry.pack.name, entry.offset, entry.length
+                )
+            except ReadError as exc:
+                if exc.status_code != 404:
+                    raise
+                # compact() has moved the entry and removed its pack meanwhile
+                moved = self._entry(name)
+                if moved is not None and moved.pack_id == entry.pack_id:
+                    raise
+                entry = moved
+        return None
+
+    def stat(self, name):
+        """
+        @return: ObjectStat or None if the name is not packed.
+        """
+        entry = self._entry(name)
+        if entry is None:
+            return None
+        return self._stat(entry)
+
+    def stat_many(self, names):
+        """
+        @return: {name: ObjectStat} of packed names.
+        """
+        names = [name for name in names if not name.startswith(PACK_PREFIX)]
+        if not names:
+            return {}
+        entries = _models().EllipticsPackedEntry.objects.filter(
+            namespace=self.namespace, name__in=names
+        )
+        return dict((entry.name, self._stat(entry)) for entry in entries)
+
+    def _stat(self, entry):
+        return ObjectStat(
+            size=entry.length, modified_time=entry.modified_time, etag=None
+        )
+
+    def delete(self, name):
+        """
+        @return: True if the name was packed.
+        """
+        entry = self._entry(name)
+        if entry is None:
+            return False
+        models = _models()
+        with atomic():
+            deleted = models.EllipticsPackedEntry.objects.filter(
+                pk=entry.pk, pack=entry.pack_id)
+            if deleted.exists():
+                deleted.delete()
+                models.EllipticsPack.objects.filter(pk=entry.pack_id).update(
+                    live_size=F('live_size') - entry.length
+                )
+        return True
+
+    def compact(self, max_live_ratio=0.5, min_age=3600):
+        """
+        Rewrite packs with few live entries into new packs, remove empty ones.
+
+        A pack is removed right after its entries are moved, get() looks up
+        an entry again when its pack is gone.
+
+        @param max_live_ratio: packs with live_size / size not above it are
+            compacted.
+        @param min_age: seconds, younger packs are left alone.
+        @return: number of packs removed.
+        """
+        models = _models()
+        packs = models.EllipticsPack.objects.filter(
+            namespace=self.namespace, created__lt=time.time() - min_age,
+            live_size__lte=F('size') * max_live_ratio
+        )
+        removed = 0
+        for pack in packs.iterator():
+            entries = list(pack.entries.order_by('offset'))
+            if entries:
+                blob = self.storage._fetch_remote(pack.name)
+                self._write_pack([
+                    (entry.name,
+                     blob[entry.offset:entry.offset + entry.length])
+                    for entry in entries
+                ], replaced_pack=pack)
+
+            with atomic():
+                if pack.entries.exists():
+                    # written to while compacting, try next time
+                    continue
+                pack.delete()
+            self.storage._delete(pack.name)
+            removed += 1
+            logger.info(
+                'Compacted pack "%s" with %d live entities',
+                pack.name, len(entries)
+            )
+        return removed
@@ -0,0 +1,83 @@
+# coding: utf-8
+import logging
+import Queue
+import threading
+import time
+
+from . import profiling
+
+logger = logging.getLogger(__name__)
+
+
+def parallel_map(func, items, workers):
+    """
+    Call func for every item in a bounded number of threads.
+
+    Exceptions do not stop other calls, they are returned instead of results.
+
+    @param workers: maximum number of threads.
+    @return: list of (item, result, exception) in the order of items.
+    @rtype: list
+    """
+    items = list(items)
+    results = [None] * len(items)
+    tasks = Queue.Queue()
+    trace = profiling.current()
+    for index, item in enumerate(items):
+        tasks.put((index, item))
+
+    def work():
+        profiling.activate(trace)
+        while True:
+            try:
+                index, item = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = item, func(item), None
+            except Exception as exc:
+                logger.debug('Parallel call for %r failed: %r', item, exc)
+                results[index] = item, None, exc
+
+    threads = [
+        threading.Thread(target=work, name='elliptics-worker-%d' % number)
+        for number in xrange(min(workers, len(items)))
+    ]
+    if len(threads) == 1:
+        work()
+        return results
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by threads: take() blocks to keep calls under rate
+    per second, bursts up to burst calls are let through at once.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
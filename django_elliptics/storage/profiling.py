@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+Context-local tracing of Elliptics requests.
+
+A trace is started for the current thread (see EllipticsProfilingMiddleware),
+every request made by EllipticsStorage._timeout_request while it is active is
+recorded into it. Threads started by the storage on behalf of the traced one
+record into the same trace.
+"""
+import collections
+import random
+import threading
+
+_local = threading.local()
+
+
+Call = collections.namedtuple(
+    'Call', 'method key bytes retries duration status'
+)
+
+
+class Trace(object):
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    @property
+    def total_duration(self):
+        return sum(call.duration for call in self.calls)
+
+    @property
+    def total_bytes(self):
+        return sum(call.bytes for call in self.calls)
+
+    def slowest(self, number):
+        """
+        Return (key, total duration, number of calls) of the slowest keys.
+        """
+        keys = {}
+        for call in self.calls:
+            duration, count = keys.get(call.key, (0, 0))
+            keys[call.key] = duration + call.duration, count + 1
+        return sorted(
+            ((key, duration, count)
+             for key, (duration, count) in keys.iteritems()),
+            key=lambda item: -item[1]
+        )[:number]
+
+    def summary(self, slowest=5):
+        return '%d calls, %.1f ms, %d bytes; slowest: %s' % (
+            len(self.calls), self.total_duration * 1000, self.total_bytes,
+            ', '.join(
+                '%s (%d x, %.1f ms)' % (key, count, duration * 1000)
+                for key, duration, count in self.slowest(slowest))
+        )
+
+    def server_timing(self):
+        return 'elliptics;dur=%.1f;desc="%d calls"' % (
+            self.total_duration * 1000, len(self.calls)
+        )
+
+
+def start(sample_rate=1.0):
+    """
+    Start a trace in the current thread, or a fraction of them.
+
+    @return: Trace or None if the request is not sampled.
+    """
+    trace = None
+    if sample_rate >= 1 or random.random() < sample_rate:
+        trace = Trace()
+    _local.trace = trace
+    return trace
+
+
+def stop():
+    """
+    Stop tracing in the current thread.
+
+    @return: Trace or None.
+    """
+    trace = current()
+    _local.trace = None
+    return trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def activate(trace):
+    """
+    Record into the trace in the current thread.
+
+    Used by threads working for a traced one.
+    """
+    _local.trace = trace
+
+
+def record(method, key, bytes, retries, duration, status):
+    trace = current()
+    if trace is not None:
+        trace.add(Call(method, key, bytes, retries, duration, status))
@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+Local disk cache of entity contents with HTTP validators.
+
+Entities are kept together with their ETag and Last-Modified, so a cached
+copy is revalidated with a conditional request instead of downloaded again.
+The cache directory may be shared by processes of a host: every entry is a
+single file replaced atomically.
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class DiskReadCache(object):
+    """
+    @param max_object_size: larger entities are not cached.
+    @param max_size: total size of the cache, the oldest entries are removed
+        when it is exceeded.
+    """
+
+    # number of writes between checks of the total size
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, namespace, max_object_size, max_size):
+        self.path = path
+        self.namespace = namespace
+        self.max_object_size = max_object_size
+        self.max_size = max_size
+        self._writes = 0
+
+    def _path(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        digest = hashlib.sha1('%s\0%s' % (self.namespace, name)).hexdigest()
+        return os.path.join(self.path, digest[:2], digest)
+
+    def get(self, name):
+        """
+        @return: (validators, content) or None.
+        @rtype: tuple
+        """
+        try:
+            with open(self._path(name), 'rb') as stream:
+                validators = json.loads(stream.readline())
+                return validators, stream.read()
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                logger.warning('Can not read cached %s: %s', name, exc)
+        except ValueError as exc:
+            logger.warning('Broken cache entry of %s: %s', name, exc)
+        return None
+
+    def set(self, name, response, content):
+        """
+        Store the content if the response has validators.
+        """
+        validators = {}
+        for header in ('etag', 'last-modified'):
+            if response.headers.get(header):
+                validators[header] = response.headers[header]
+        if not validators or len(content) > self.max_object_size:
+            self.delete(name)
+            return
+
+        path = self._path(name)
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            descriptor, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(descriptor, 'wb') as stream:
+                stream.write(json.dumps(validators) + '\n')
+                stream.write(content)
+            os.rename(temp_path, path)
+        except (IOError, OSError) as exc:
+            logger.warning('Can not cache %s: %s', name, exc)
+            return
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, name):
+        try:
+            os.unlink(self._path(name))
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def conditional_headers(self, validators):
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last-modified' in validators:
+            headers['If-Modified-Since'] = validators['last-modified']
+        return headers
+
+    def prune(self):
+        """
+        Remove the least recently used entries above max_size.
+        """
+        entries = []
+        total = 0
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
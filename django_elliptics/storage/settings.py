@@ -20,8 +20,58 @@ ELLIPTICS_POST_CONNECTION_TIMEOUT = 5
 ELLIPTICS_POST_CONNECTION_RETRIES = 9
 # size of a chunk in bytes, to split content into
 ELLIPTICS_UPLOAD_CHUNK_SIZE = 3 * 1024 * 1024
+# content of unknown size is spooled before the upload: up to this number of
+# bytes in memory, the rest in a temporary file
+ELLIPTICS_SPOOL_MEMORY_SIZE = 3 * 1024 * 1024
 # maximum number of instantaneous http-sessions to elliptics
 ELLIPTICS_MAX_SESSIONS = 5
+# replica groups to route reads to, e.g. [1, 2, 3]; reads go to the fastest
+# healthy group with the "groups" parameter. Empty means no preference.
+ELLIPTICS_READ_GROUPS = ()
+# checksum algorithm (crc32, md5, sha1, sha256, also xxhash or crc32c if the
+# modules are installed) to verify content with, None disables checksums
+ELLIPTICS_CHECKSUM = None
+# entities up to this number of bytes are packed into shared blobs,
+# 0 disables packing (see django_elliptics.storage.packing)
+ELLIPTICS_PACK_THRESHOLD = 0
+# a pack is uploaded as soon as it has this number of bytes
+ELLIPTICS_PACK_SIZE = 4 * 1024 * 1024
+# seconds a writer waits for others to share a pack with
+ELLIPTICS_PACK_DELAY = 0.05
+# number of entities to keep metadata (size, modification time) of
+ELLIPTICS_METADATA_CACHE_SIZE = 10000
+# seconds to keep metadata of an entity
+ELLIPTICS_METADATA_CACHE_TIMEOUT = 60
+# storage.appender() sends buffered appends to a name when this many bytes
+# are gathered or the oldest of them is this many seconds old
+ELLIPTICS_APPEND_BUFFER_SIZE = 64 * 1024
+ELLIPTICS_APPEND_FLUSH_INTERVAL = 1.0
+# directory of the local write journal, None disables the journal
+ELLIPTICS_JOURNAL_PATH = None
+# seconds to wait before replaying a journaled write again after a failure
+ELLIPTICS_JOURNAL_RETRY_DELAY = 5
+# a journaled write failing this many times in a row is moved aside
+ELLIPTICS_JOURNAL_MAX_RETRIES = 10
+# a journal segment is rotated when it grows above this number of bytes
+ELLIPTICS_JOURNAL_SEGMENT_SIZE = 64 * 1024 * 1024
+# directory of the local cache of read entities, None disables the cache.
+# Cached copies are revalidated with ETag / Last-Modified on every read.
+ELLIPTICS_READ_CACHE_PATH = None
+# entities larger than this number of bytes are not cached
+ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE = 16 * 1024 * 1024
+# total size of the read cache in bytes
+ELLIPTICS_READ_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+# fraction of requests traced by EllipticsProfilingMiddleware
+ELLIPTICS_PROFILING_SAMPLE_RATE = 1.0
+# add Server-Timing header with Elliptics time to traced responses
+ELLIPTICS_PROFILING_HEADER = True
+# number of the slowest keys in the log record of a traced request
+ELLIPTICS_PROFILING_SLOWEST = 5
+# location of nginx, which proxies to Elliptics, for X-Accel-Redirect responses
+# of django_elliptics.views.serve. None makes Django stream the content.
+ELLIPTICS_ACCEL_REDIRECT_PREFIX = None
+# path to the SQLite database with the index of keys, None disables the index
+ELLIPTICS_INDEX_PATH = None
 
 
 if DJANGO_ENABLED:
@@ -55,3 +105,113 @@ if DJANGO_ENABLED:
         'ELLIPTICS_MAX_SESSIONS',
         ELLIPTICS_MAX_SESSIONS
     )
+    ELLIPTICS_SPOOL_MEMORY_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_SPOOL_MEMORY_SIZE',
+        ELLIPTICS_SPOOL_MEMORY_SIZE
+    )
+    ELLIPTICS_JOURNAL_PATH = getattr(
+        conf.settings,
+        'ELLIPTICS_JOURNAL_PATH',
+        ELLIPTICS_JOURNAL_PATH
+    )
+    ELLIPTICS_JOURNAL_RETRY_DELAY = getattr(
+        conf.settings,
+        'ELLIPTICS_JOURNAL_RETRY_DELAY',
+        ELLIPTICS_JOURNAL_RETRY_DELAY
+    )
+    ELLIPTICS_METADATA_CACHE_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_METADATA_CACHE_SIZE',
+        ELLIPTICS_METADATA_CACHE_SIZE
+    )
+    ELLIPTICS_METADATA_CACHE_TIMEOUT = getattr(
+        conf.settings,
+        'ELLIPTICS_METADATA_CACHE_TIMEOUT',
+        ELLIPTICS_METADATA_CACHE_TIMEOUT
+    )
+    ELLIPTICS_INDEX_PATH = getattr(
+        conf.settings,
+        'ELLIPTICS_INDEX_PATH',
+        ELLIPTICS_INDEX_PATH
+    )
+    ELLIPTICS_ACCEL_REDIRECT_PREFIX = getattr(
+        conf.settings,
+        'ELLIPTICS_ACCEL_REDIRECT_PREFIX',
+        ELLIPTICS_ACCEL_REDIRECT_PREFIX
+    )
+    ELLIPTICS_READ_CACHE_PATH = getattr(
+        conf.settings,
+        'ELLIPTICS_READ_CACHE_PATH',
+        ELLIPTICS_READ_CACHE_PATH
+    )
+    ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE',
+        ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE
+    )
+    ELLIPTICS_READ_CACHE_MAX_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_READ_CACHE_MAX_SIZE',
+        ELLIPTICS_READ_CACHE_MAX_SIZE
+    )
+    ELLIPTICS_APPEND_BUFFER_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_APPEND_BUFFER_SIZE',
+        ELLIPTICS_APPEND_BUFFER_SIZE
+    )
+    ELLIPTICS_APPEND_FLUSH_INTERVAL = getattr(
+        conf.settings,
+        'ELLIPTICS_APPEND_FLUSH_INTERVAL',
+        ELLIPTICS_APPEND_FLUSH_INTERVAL
+    )
+    ELLIPTICS_CHECKSUM = getattr(
+        conf.settings,
+        'ELLIPTICS_CHECKSUM',
+        ELLIPTICS_CHECKSUM
+    )
+    ELLIPTICS_PROFILING_SAMPLE_RATE = getattr(
+        conf.settings,
+        'ELLIPTICS_PROFILING_SAMPLE_RATE',
+        ELLIPTICS_PROFILING_SAMPLE_RATE
+    )
+    ELLIPTICS_PROFILING_HEADER = getattr(
+        conf.settings,
+        'ELLIPTICS_PROFILING_HEADER',
+        ELLIPTICS_PROFILING_HEADER
+    )
+    ELLIPTICS_PROFILING_SLOWEST = getattr(
+        conf.settings,
+        'ELLIPTICS_PROFILING_SLOWEST',
+        ELLIPTICS_PROFILING_SLOWEST
+    )
+    ELLIPTICS_READ_GROUPS = getattr(
+        conf.settings,
+        'ELLIPTICS_READ_GROUPS',
+        ELLIPTICS_READ_GROUPS
+    )
+    ELLIPTICS_PACK_THRESHOLD = getattr(
+        conf.settings,
+        'ELLIPTICS_PACK_THRESHOLD',
+        ELLIPTICS_PACK_THRESHOLD
+    )
+    ELLIPTICS_PACK_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_PACK_SIZE',
+        ELLIPTICS_PACK_SIZE
+    )
+    ELLIPTICS_PACK_DELAY = getattr(
+        conf.settings,
+        'ELLIPTICS_PACK_DELAY',
+        ELLIPTICS_PACK_DELAY
+    )
+    ELLIPTICS_JOURNAL_MAX_RETRIES = getattr(
+        conf.settings,
+        'ELLIPTICS_JOURNAL_MAX_RETRIES',
+        ELLIPTICS_JOURNAL_MAX_RETRIES
+    )
+    ELLIPTICS_JOURNAL_SEGMENT_SIZE = getattr(
+        conf.settings,
+        'ELLIPTICS_JOURNAL_SEGMENT_SIZE',
+        ELLIPTICS_JOURNAL_SEGMENT_SIZE
+    )
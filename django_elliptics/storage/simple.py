@@ -1,17 +1,40 @@
 # coding: utf-8
+import contextlib
 import logging
+import tempfile
 import time
 import socket
 import urllib
 
 import requests
 
-from .base import BaseEllipticsStorage
+from . import profiling, warmup
+from .appender import BufferedAppender
+from .base import BaseEllipticsStorage, ObjectStat
+from .cache import LRUCache
+from .checksum import (
+    SIDECAR_SUFFIX, ChecksumReader, Manifest, new_digest
+)
 from .errors import *
+from .groups import GroupSelector
+from .index import KeyIndex
+from .journal import WriteJournal
+from .packing import PackedStore
+from .pool import parallel_map
+from .readcache import DiskReadCache
+from .singleflight import SingleFlight
 from .settings import (
     ELLIPTICS_GET_CONNECTION_TIMEOUT, ELLIPTICS_GET_CONNECTION_RETRIES,
     ELLIPTICS_POST_CONNECTION_RETRIES, ELLIPTICS_POST_CONNECTION_TIMEOUT,
-    ELLIPTICS_UPLOAD_CHUNK_SIZE
+    ELLIPTICS_UPLOAD_CHUNK_SIZE, ELLIPTICS_MAX_SESSIONS,
+    ELLIPTICS_METADATA_CACHE_SIZE, ELLIPTICS_METADATA_CACHE_TIMEOUT,
+    ELLIPTICS_JOURNAL_PATH, ELLIPTICS_JOURNAL_RETRY_DELAY, ELLIPTICS_INDEX_PATH,
+    ELLIPTICS_JOURNAL_MAX_RETRIES, ELLIPTICS_JOURNAL_SEGMENT_SIZE,
+    ELLIPTICS_READ_CACHE_PATH, ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE,
+    ELLIPTICS_READ_CACHE_MAX_SIZE, ELLIPTICS_APPEND_BUFFER_SIZE,
+    ELLIPTICS_APPEND_FLUSH_INTERVAL, ELLIPTICS_CHECKSUM, ELLIPTICS_READ_GROUPS,
+    ELLIPTICS_SPOOL_MEMORY_SIZE, ELLIPTICS_PACK_THRESHOLD, ELLIPTICS_PACK_SIZE,
+    ELLIPTICS_PACK_DELAY
 )
 
 logger = logging.getLogger(__name__)
@@ -22,13 +45,10 @@ FAILED_MESSAGE = (
     '(%s %s). Timeout: %s seconds. "%s"'
 )
 
-# It is a very bad to write big files into elliptics without knowing it's size.
-# That is because E does not have transactions and you will read what has not
-# been written completely.
-BAD_IDEA_TO_WRITE_MESSAGE = (
-    'It is a very bad idea to write to Elliptics'
-    'entities of unknown size'
-)
+# Elliptics does not have transactions, an entity written piece by piece is
+# visible half-written. Content of unknown size is spooled locally first, so it
+# can be uploaded with prepare/commit like any other.
+SPOOLING_MESSAGE = 'Spooling content of unknown size for "%s"'
 
 
 class EllipticsStorage(BaseEllipticsStorage):
@@ -37,6 +57,30 @@ class EllipticsStorage(BaseEllipticsStorage):
 
     Configuration: same as in base class + some more.
     Supports timeouts and retries on failure (see the config).
+
+    Concurrent reads of the same name in threads share a single request.
+
+    When ELLIPTICS_READ_GROUPS is set, reads go to a single replica group:
+    the fastest healthy one, other groups are tried on failures.
+
+    When ELLIPTICS_CHECKSUM is set, checksums of every uploaded chunk are
+    computed on the fly and stored in a sidecar entity, reads are verified
+    against them and only corrupted chunks are downloaded again.
+
+    Metadata returned by stat() is cached in process for
+    ELLIPTICS_METADATA_CACHE_TIMEOUT seconds and dropped on writes.
+
+    When ELLIPTICS_READ_CACHE_PATH is set, read entities are kept on local
+    disk and revalidated with conditional requests instead of downloaded.
+
+    When ELLIPTICS_JOURNAL_PATH is set, writes are acknowledged as soon as
+    they are in the local journal and are sent to Elliptics in background.
+
+    When ELLIPTICS_PACK_THRESHOLD is set and the journal is not used, small
+    entities are packed into shared blobs.
+
+    When ELLIPTICS_INDEX_PATH is set, names of saved entities are recorded
+    in a local SQLite index, which makes listdir() and scan() work.
     """
 
     timeout_get = ELLIPTICS_GET_CONNECTION_TIMEOUT
@@ -44,6 +88,58 @@ class EllipticsStorage(BaseEllipticsStorage):
     timeout_post = ELLIPTICS_POST_CONNECTION_TIMEOUT
     retries_post = ELLIPTICS_POST_CONNECTION_RETRIES
     MAX_CHUNK_SIZE = ELLIPTICS_UPLOAD_CHUNK_SIZE
+    SPOOL_MEMORY_SIZE = ELLIPTICS_SPOOL_MEMORY_SIZE
+    MAX_PARALLEL_REQUESTS = ELLIPTICS_MAX_SESSIONS
+    CHECKSUM = ELLIPTICS_CHECKSUM
+    READ_GROUPS = ELLIPTICS_READ_GROUPS
+    METADATA_CACHE_SIZE = ELLIPTICS_METADATA_CACHE_SIZE
+    METADATA_CACHE_TIMEOUT = ELLIPTICS_METADATA_CACHE_TIMEOUT
+    JOURNAL_PATH = ELLIPTICS_JOURNAL_PATH
+    JOURNAL_RETRY_DELAY = ELLIPTICS_JOURNAL_RETRY_DELAY
+    JOURNAL_MAX_RETRIES = ELLIPTICS_JOURNAL_MAX_RETRIES
+    JOURNAL_SEGMENT_SIZE = ELLIPTICS_JOURNAL_SEGMENT_SIZE
+    INDEX_PATH = ELLIPTICS_INDEX_PATH
+    PACK_THRESHOLD = ELLIPTICS_PACK_THRESHOLD
+    PACK_SIZE = ELLIPTICS_PACK_SIZE
+    PACK_DELAY = ELLIPTICS_PACK_DELAY
+    READ_CACHE_PATH = ELLIPTICS_READ_CACHE_PATH
+    READ_CACHE_MAX_OBJECT_SIZE = ELLIPTICS_READ_CACHE_MAX_OBJECT_SIZE
+    READ_CACHE_MAX_SIZE = ELLIPTICS_READ_CACHE_MAX_SIZE
+    APPEND_BUFFER_SIZE = ELLIPTICS_APPEND_BUFFER_SIZE
+    APPEND_FLUSH_INTERVAL = ELLIPTICS_APPEND_FLUSH_INTERVAL
+
+    def __init__(self, **kwargs):
+        super(EllipticsStorage, self).__init__(**kwargs)
+        if self.CHECKSUM:
+            # fail early on unknown algorithms
+            new_digest(self.CHECKSUM)
+        self.flights = SingleFlight()
+        self.read_groups = None
+        if self.READ_GROUPS:
+            self.read_groups = GroupSelector(self.READ_GROUPS)
+        self.metadata_cache = LRUCache(
+            self.METADATA_CACHE_SIZE, self.METADATA_CACHE_TIMEOUT
+        )
+        self.journal = None
+        if self.JOURNAL_PATH:
+            self.journal = WriteJournal(
+                self, self.JOURNAL_PATH, self.JOURNAL_RETRY_DELAY,
+                self.JOURNAL_MAX_RETRIES, self.JOURNAL_SEGMENT_SIZE
+            )
+        self.packs = None
+        if self.PACK_THRESHOLD and self.journal is None:
+            self.packs = PackedStore(
+                self, self.PACK_THRESHOLD, self.PACK_SIZE, self.PACK_DELAY
+            )
+        self.index = None
+        if self.INDEX_PATH:
+            self.index = KeyIndex(self.INDEX_PATH, self.settings.prefix)
+        self.read_cache = None
+        if self.READ_CACHE_PATH:
+            self.read_cache = DiskReadCache(
+                self.READ_CACHE_PATH, self.settings.prefix,
+                self.READ_CACHE_MAX_OBJECT_SIZE, self.READ_CACHE_MAX_SIZE
+            )
 
     def _request(self, method, url, *args, **kwargs):
         if method in ('POST', 'GET', 'HEAD'):
@@ -54,13 +150,19 @@ class EllipticsStorage(BaseEllipticsStorage):
             raise NotImplementedError('The requested method is not acceptable')
 
     def _timeout_request(self, method, url, *args, **kwargs):
+        """
+        @param retries: overrides the number of tries from the config.
+        """
         error_message = ''
+        traced = profiling.current() is not None
+        first_started = time.time()
         if method == 'POST':
             retries = self.retries_post
             timeout = self.timeout_post
         else:
             retries = self.retries_get
             timeout = self.timeout_get
+        retries = kwargs.pop('retries', None) or retries
 
         for retry_count in xrange(retries):
             try:
@@ -86,6 +188,9 @@ class EllipticsStorage(BaseEllipticsStorage):
                 FAILED_MESSAGE,
                 retry_count + 1, retries, method, url, timeout, error_message
             )
+            if traced:
+                self._trace(method, url, kwargs, None, retry_count,
+                            first_started)
             raise TimeoutError(error_message)
 
         if retry_count:
@@ -94,15 +199,431 @@ class EllipticsStorage(BaseEllipticsStorage):
                 retry_count, retries, method, url, timeout, error_message
             )
 
+        if traced:
+            self._trace(method, url, kwargs, response, retry_count,
+                        first_started)
         return response
 
+    def _trace(self, method, url, kwargs, response, retries, started):
+        """
+        Record the request into the trace of the current thread.
+        """
+        if method == 'POST':
+            data = kwargs.get('data')
+            size = len(data) if isinstance(data, basestring) else 0
+        else:
+            size = int(response and response.headers.get('content-length') or 0)
+
+        path = url
+        private_url = self.settings.private_url.rstrip('/') + '/'
+        if path.startswith(private_url):
+            path = path[len(private_url):]
+        # strip the command and the query
+        key = urllib.unquote(path.split('?', 1)[0].split('/', 1)[-1])
+
+        profiling.record(
+            method, key, size, retries, time.time() - started,
+            response.status_code if response is not None else None
+        )
+
+    def delete(self, name):
+        with self._writing(name):
+            if self.read_cache is not None:
+                self.read_cache.delete(name)
+            if self.index is not None:
+                self.index.remove(name)
+            if self.packs is not None:
+                # the name may be in Elliptics as well, written before packing
+                self.packs.delete(name)
+            if self.journal is not None and self.journal.delete(name):
+                return
+            self._delete(name)
+
+    @contextlib.contextmanager
+    def _writing(self, name):
+        """
+        Keep reads of the name from being shared across a write of it.
+
+        Reads started before the write must not be joined by the ones
+        started during it, and reads started during the write must not be
+        joined by the ones started after it. The same goes for metadata:
+        a HEAD answered during the write may be stale.
+        """
+        self.flights.forget(name)
+        self.metadata_cache.delete(name)
+        try:
+            yield
+        finally:
+            self.flights.forget(name)
+            self.metadata_cache.delete(name)
+
+    def listdir(self, path):
+        """
+        Return (directories, files) under the path, known to the index.
+        """
+        if self.index is None:
+            raise NotImplementedError('ELLIPTICS_INDEX_PATH is not set')
+        return self.index.listdir(path)
+
+    def scan(self, prefix='', start=None, stop=None, limit=None):
+        """
+        Iterate over (name, size, modified_time) known to the index.
+
+        See KeyIndex.scan.
+        """
+        if self.index is None:
+            raise NotImplementedError('ELLIPTICS_INDEX_PATH is not set')
+        return self.index.scan(prefix, start, stop, limit)
+
+    def _delete(self, name):
+        with self._writing(name):
+            url = self._make_private_url('delete', name)
+            self._timeout_request('GET', url)
+            if self.CHECKSUM:
+                self._delete_manifest(name)
+
+    def exists(self, name):
+        if self.journal is not None:
+            exists = self.journal.exists(name)
+            if exists is not None:
+                return exists
+        if self.packs is not None and self.packs.stat(name) is not None:
+            return True
+        if self.metadata_cache.get(name) is not None:
+            return True
+        return super(EllipticsStorage, self).exists(name)
+
+    def stat(self, name, fresh=False):
+        """
+        Return ObjectStat of the name.
+
+        Costs a HEAD request at most, no content is downloaded.
+
+        @param fresh: do not use the metadata cache, which may be stale after
+            writes of other processes.
+        @raise: ReadError
+        """
+        if self.packs is not None:
+            stat = self.packs.stat(name)
+            if stat is not None:
+                return stat
+        return self._stat_unpacked(name, fresh)
+
+    def _stat_unpacked(self, name, fresh=False):
+        if self.journal is not None:
+            stat = self.journal.stat(name)
+            if stat is not None:
+                return stat
+        stat = None if fresh else self.metadata_cache.get(name)
+        if stat is None:
+            stat = self._stat_remote(name)
+        return stat
+
+    def stat_many(self, names):
+        """
+        Return ObjectStat of every name, asking Elliptics in parallel.
+
+        Names missing from Elliptics are missing from the result.
+
+        @rtype: dict
+        @raise: ReadError if a name can not be stat'ed for another reason,
+            e.g. a timeout.
+        """
+        result = {}
+        if self.packs is not None:
+            # a single query instead of one per name
+            result = self.packs.stat_many(names)
+            names = [name for name in names if name not in result]
+        for name, stat, exc in parallel_map(
+                self._stat_unpacked, names, self.MAX_PARALLEL_REQUESTS):
+            if exc is None:
+                result[name] = stat
+                continue
+            missing = isinstance(exc, NotFoundError) or (
+                isinstance(exc, ReadError) and exc.status_code == 404
+            )
+            if not missing:
+                raise exc
+        return result
+
+    def warm_up(self, names, rate=None, workers=None, content=True,
+                progress=None):
+        """
+        Fill the metadata cache and the read cache with the names.
+
+        See django_elliptics.storage.warmup.warm_up.
+
+        @rtype: WarmUpResult
+        """
+        return warmup.warm_up(
+            self, names, rate=rate, workers=workers, content=content,
+            progress=progress
+        )
+
+    def _stat_remote(self, name):
+        # a save or delete during the request makes its answer stale
+        stamp = self.metadata_cache.stamp()
+        response = self._head(name)
+        if response.status_code != 200:
+            raise ReadError(response)
+        stat = ObjectStat.from_response(response)
+        self.metadata_cache.set(name, stat, stamp=stamp)
+        return stat
+
+    def _head(self, name):
+        return self.flights.do(
+            (name, 'HEAD'), self._read_request, 'HEAD', name
+        )
+
+    def _read_request(self, method, name, headers=None, **args):
+        """
+        Send a read request, to the best replica group if groups are set.
+
+        The first group to answer 200 or 304 wins. Every group but the last
+        one gets a single try, so a slow group does not hold the read.
+        After a 404 Elliptics is asked once more without groups, rather than
+        group by group: a missing name would cost a request per group.
+        Group statistics are updated on every answer.
+        """
+        if self.read_groups is None:
+            url = self._make_private_url('get', name, **args)
+            return self._timeout_request(method, url, headers=headers)
+
+        groups = self.read_groups.order()
+        response = error = None
+        for number, group in enumerate(groups):
+            url = self._make_private_url('get', name, groups=group, **args)
+            started = time.time()
+            try:
+                response = self._timeout_request(
+                    method, url, headers=headers,
+                    retries=1 if number < len(groups) - 1 else None
+                )
+            except TimeoutError as exc:
+                self.read_groups.report(group, time.time() - started, False)
+                error = exc
+                continue
+
+            # a missing entity may be not replicated yet, it is no failure
+            self.read_groups.report(
+                group, time.time() - started, response.status_code < 500
+            )
+            if response.status_code in (200, 304):
+                return response
+            if response.status_code == 404:
+                url = self._make_private_url('get', name, **args)
+                return self._timeout_request(method, url, headers=headers)
+            logger.info(
+                'Group %s answered %d for "%s", trying the next one',
+                group, response.status_code, name
+            )
+
+        if response is not None:
+            return response
+        raise error
+
     def _fetch(self, name):
-        url = self._make_private_url('get', name)
-        response = self._timeout_request('GET', url)
+        if self.journal is not None:
+            content = self.journal.read(name)
+            if content is not None:
+                return content
+        if self.packs is not None:
+            content = self.packs.get(name)
+            if content is not None:
+                return content
+        return self._fetch_remote(name)
+
+    def _fetch_remote(self, name):
+        return self.flights.do((name, 'GET'), self._get, name)
+
+    def _get(self, name):
+        cached = None
+        headers = {}
+        if self.read_cache is not None:
+            cached = self.read_cache.get(name)
+            if cached is not None:
+                headers = self.read_cache.conditional_headers(cached[0])
+
+        response = self._read_request('GET', name, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            logger.debug('Cached copy of "%s" is still valid', name)
+            return cached[1]
 
         if response.status_code != 200:
             logger.warning('Elliptics read error status %d, url %s',
-                           response.status_code, url, extra={'stack': True})
+                           response.status_code, response.url,
+                           extra={'stack': True})
+            raise ReadError(response)
+
+        content = response.content
+        if self.CHECKSUM:
+            content = self._verify(
+                name, content, ObjectStat.from_response(response)
+            )
+
+        if self.read_cache is not None:
+            self.read_cache.set(name, response, content)
+        return content
+
+    def _verify(self, name, content, stat):
+        """
+        Check the content against its manifest, download bad chunks again.
+
+        @param stat: ObjectStat of the response with the content.
+        @raise: ChecksumError
+        """
+        manifest = self._fetch_manifest(name, stat)
+        if manifest is not None and len(content) != manifest.size:
+            # the entity may be being rewritten, its sidecar goes last
+            manifest = self._fetch_manifest(name, stat)
+            if manifest is not None and len(content) != manifest.size:
+                raise ChecksumError(
+                    '%s has %d bytes, its checksums are of %d' % (
+                        name, len(content), manifest.size)
+                )
+        if manifest is None:
+            return content
+
+        bad_chunks = manifest.bad_chunks(content)
+        if not bad_chunks:
+            return content
+
+        logger.warning(
+            'Checksum mismatch of %d chunks of "%s", downloading them again',
+            len(bad_chunks), name
+        )
+        chunks = [
+            content[offset:offset + size] for offset, size in (
+                manifest.chunk_range(index)
+                for index in xrange(len(manifest.chunks)))
+        ]
+        for index in bad_chunks:
+            offset, size = manifest.chunk_range(index)
+            chunks[index] = self._fetch_verified_range(
+                name, manifest, offset, size
+            )
+        return ''.join(chunks)
+
+    def _fetch_verified_range(self, name, manifest, offset, size):
+        for _ in xrange(self.retries_get):
+            chunk = self._fetch_range(name, offset, size)
+            if manifest.check_chunk(offset, chunk):
+                return chunk
+        raise ChecksumError(
+            'checksum mismatch of %s at %d-%d' % (name, offset, offset + size)
+        )
+
+    def _fetch_manifest(self, name, stat):
+        """
+        @param stat: ObjectStat of the entity.
+        @return: Manifest or None for entities stored without checksums,
+            and for entities written after the manifest.
+        """
+        response = self._read_request('GET', name + SIDECAR_SUFFIX)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ReadError(response)
+        manifest = Manifest.loads(response.content)
+        if not manifest.describes(stat):
+            logger.info('Checksums of "%s" are stale, ignored', name)
+            return None
+        return manifest
+
+    def _store_manifest(self, name, manifest):
+        # the manifest has to recognize the entity it was computed for,
+        # another size means a concurrent write has replaced it already
+        response = self._read_request('HEAD', name)
+        stat = None
+        if response.status_code == 200:
+            stat = ObjectStat.from_response(response)
+        if stat is None or stat.size != manifest.size:
+            logger.info(
+                'Checksums of "%s" are not stored, it has been changed', name
+            )
+            return
+        manifest.etag = stat.etag
+        manifest.modified_time = stat.modified_time
+        data = manifest.dumps()
+        self._save_file(name + SIDECAR_SUFFIX, data, len(data))
+
+    def _delete_manifest(self, name):
+        url = self._make_private_url('delete', name + SIDECAR_SUFFIX)
+        self._timeout_request('GET', url)
+
+    def appender(self, max_size=None, interval=None):
+        """
+        Return BufferedAppender gathering small appends into larger requests.
+
+        @param max_size: bytes, APPEND_BUFFER_SIZE by default.
+        @param interval: seconds, APPEND_FLUSH_INTERVAL by default.
+        """
+        return BufferedAppender(
+            self,
+            max_size or self.APPEND_BUFFER_SIZE,
+            interval if interval is not None else self.APPEND_FLUSH_INTERVAL
+        )
+
+    def iter_content(self, name, offset=0, size=None, chunk_size=None):
+        """
+        Yield the content of the name piece by piece.
+
+        Every piece is a separate request with offset and size, so a long
+        transfer never holds the whole entity in memory.
+
+        @param size: number of bytes to read, the rest of the entity if None.
+            When the size of the entity is unknown too, pieces are read
+            until a short one.
+        @param chunk_size: size of a piece, MAX_CHUNK_SIZE by default.
+        """
+        chunk_size = chunk_size or self.MAX_CHUNK_SIZE
+        if size is None:
+            size = self.size(name)
+            if size is not None:
+                size -= offset
+        end = offset + size if size is not None else None
+
+        manifest = None
+        if self.CHECKSUM:
+            manifest = self._fetch_manifest(name, self.stat(name, fresh=True))
+
+        while end is None or offset < end:
+            chunk_length = chunk_size
+            if end is not None:
+                chunk_length = min(chunk_size, end - offset)
+            chunk = self._fetch_range(name, offset, chunk_length)
+            if manifest is not None and not manifest.check_chunk(offset, chunk):
+                # only pieces which are whole chunks can be checked
+                chunk = self._fetch_verified_range(
+                    name, manifest, offset, chunk_length
+                )
+            if not chunk:
+                break
+            yield chunk
+            offset += len(chunk)
+            if end is None and len(chunk) < chunk_length:
+                break
+
+    def _fetch_range(self, name, offset, size):
+        if self.journal is not None:
+            content = self.journal.read(name)
+            if content is not None:
+                return content[offset:offset + size]
+        if self.packs is not None:
+            content = self.packs.get(name)
+            if content is not None:
+                return content[offset:offset + size]
+
+        response = self.flights.do(
+            (name, 'GET', offset, size), self._read_request, 'GET', name,
+            offset=offset, size=size
+        )
+
+        if response.status_code != 200:
+            logger.warning('Elliptics read error status %d, url %s',
+                           response.status_code, response.url,
+                           extra={'stack': True})
             raise ReadError(response)
 
         return response.content
@@ -114,28 +635,64 @@ class EllipticsStorage(BaseEllipticsStorage):
 
         @raise: BaseError
         """
+        with self._writing(name):
+            if self.journal is not None:
+                length = self.journal.write(
+                    name, content, append=append).length
+            elif self.packs is not None:
+                length = self._store_packed(name, content, append=append)
+            else:
+                length = self._store(name, content, append=append)
+
+        if self.index is not None:
+            if append:
+                self.index.append(name, length or 0, time.time())
+            else:
+                self.index.update(name, length, time.time())
+        return name
+
+    def _store(self, name, content, append=False):
+        """
+        Send the content to Elliptics right away.
+
+        @return: number of bytes sent, None if it is unknown.
+        @raise: BaseError
+        """
+        with self._writing(name):
+            if self.read_cache is not None:
+                self.read_cache.delete(name)
+            return self._upload(name, content, append)
+
+    def _upload(self, name, content, append):
         args = {}
         if append:
+            if self.CHECKSUM:
+                # the manifest does not describe the entity any more
+                self._delete_manifest(name)
             self._save_with_append(name, content, **args)
-            return name
+            try:
+                return self.__guess_content_size(content)[1]
+            except NotImplementedError:
+                return None
 
         try:
             content, length = self.__guess_content_size(content)
         except NotImplementedError:
-            logger.error(BAD_IDEA_TO_WRITE_MESSAGE)
-            # length is unknown, so we append
-            uploaded = 0
-            while True:
-                chunk = self._create_chunk(
-                    content, uploaded, self.MAX_CHUNK_SIZE
-                )
-                if not chunk:
-                    return name
-                self._save_with_append(name, chunk, **args)
-                uploaded += len(chunk)
-
+            logger.info(SPOOLING_MESSAGE, name)
+            content, length = self._spool(content)
+
+        if self.CHECKSUM:
+            # readers must not check the new content against the old
+            # manifest while it is being uploaded
+            self._delete_manifest(name)
+            content = ChecksumReader(
+                content, length, self.CHECKSUM, self.MAX_CHUNK_SIZE,
+                self._create_chunk
+            )
         self._save_file(name, content, length, **args)
-        return name
+        if self.CHECKSUM:
+            self._store_manifest(name, content.manifest())
+        return length
 
     def _save_with_append(self, name, content, **args):
         args['ioflags'] = 2  # DNET_IO_FLAGS_APPEND = (1<<1)
@@ -147,6 +704,60 @@ class EllipticsStorage(BaseEllipticsStorage):
 
         return name
 
+    def _store_packed(self, name, content, append=False):
+        """
+        Pack small content, store the rest as usual.
+
+        A packed entity which grows above the threshold is unpacked.
+
+        @return: number of bytes stored, None if it is unknown.
+        """
+        if append:
+            packed = self.packs.get(name)
+            if packed is None:
+                return self._store(name, content, append=True)
+            content = packed + self._read_all(content)
+
+        try:
+            content, length = self.__guess_content_size(content)
+        except NotImplementedError:
+            length = None
+
+        if self.packs.accepts(name, length):
+            data = self._read_all(content)
+            self.packs.put(name, data)
+            return len(data)
+
+        length = self._store(name, content)
+        self.packs.delete(name)
+        return length
+
+    def _read_all(self, content):
+        if hasattr(content, 'read'):
+            return content.read()
+        return content
+
+    def _spool(self, content):
+        """
+        Read content of unknown size into a local temporary file.
+
+        Up to SPOOL_MEMORY_SIZE bytes are kept in memory, the rest goes to
+        disk. The whole stream has to be read before the upload starts,
+        because the first request of a chunked upload reserves the space.
+
+        @return: (file, length)
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MEMORY_SIZE)
+        length = 0
+        while True:
+            chunk = self._create_chunk(content, length, self.MAX_CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+            length += len(chunk)
+        spool.seek(0)
+        return spool, length
+
     def __guess_content_size(self, content):
         """
         Return content and its size.
@@ -0,0 +1,59 @@
+# coding: utf-8
+import sys
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time, keys are tuples (name, ...).
+
+    Threads asking for a key which is already being fetched wait for that
+    call and get its result or its exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def forget(self, name):
+        """
+        Make the next calls for the name start anew.
+
+        Keys are tuples starting with the name. Used when the data behind
+        the name changes, so nobody joins a call returning the old data.
+        """
+        with self._lock:
+            for key in [key for key in self._calls if key[0] == name]:
+                del self._calls[key]
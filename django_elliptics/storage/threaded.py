@@ -2,6 +2,7 @@
 import logging
 import threading
 
+from . import profiling
 from .base import SaveError, BaseError
 from .simple import EllipticsStorage
 from .settings import ELLIPTICS_MAX_SESSIONS
@@ -92,13 +93,14 @@ class ThreadedEllipticsStorage(EllipticsStorage):
         thread = threading.Thread(
             target=self._timeout_request_with_result,
             name='elliptics-loader-%s' % len(self.__active_threads),
-            args=('POST', url),
+            args=(profiling.current(), 'POST', url),
             kwargs=dict(data=chunk)
         )
         self.__active_threads[thread] = None
         thread.start()
 
-    def _timeout_request_with_result(self, *args, **kwargs):
+    def _timeout_request_with_result(self, trace, *args, **kwargs):
+        profiling.activate(trace)
         try:
             response = self._timeout_request(*args, **kwargs)
         except BaseError as exc:
@@ -0,0 +1,94 @@
+# coding: utf-8
+"""
+Warming up local caches before a worker takes traffic.
+
+Metadata of every name is loaded into the metadata cache, content of small
+enough entities into the read cache (ELLIPTICS_READ_CACHE_PATH). Names are
+processed in batches by parallel threads, under a common request rate.
+"""
+import itertools
+import logging
+import time
+
+from .errors import *
+from .pool import RateLimiter, parallel_map
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUpResult(object):
+    """
+    Progress of a warm-up, updated after every batch.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.names = 0
+        self.failed = 0
+        self.bytes = 0
+
+    @property
+    def duration(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def names_per_second(self):
+        return self.names / max(self.duration, 1e-6)
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / max(self.duration, 1e-6)
+
+    def __str__(self):
+        return (
+            '%d names (%d failed), %d bytes in %.1f s: '
+            '%.1f names/s, %.1f KB/s'
+        ) % (
+            self.names, self.failed, self.bytes, self.duration,
+            self.names_per_second, self.bytes_per_second / 1024
+        )
+
+
+def warm_up(storage, names, rate=None, workers=None, content=True,
+            progress=None, batch_size=1000):
+    """
+    @param names: iterable of names, e.g. a queryset values_list iterator.
+    @param rate: maximum number of names per second, None is unlimited.
+    @param workers: number of threads, MAX_PARALLEL_REQUESTS by default.
+    @param content: fetch content into the read cache, if it is enabled.
+    @param progress: callable(WarmUpResult) called after every batch.
+    @rtype: WarmUpResult
+    """
+    limiter = RateLimiter(rate) if rate else None
+    fetch = content and storage.read_cache is not None
+
+    def load(name):
+        if limiter is not None:
+            limiter.take()
+        stat = storage.stat(name)
+        if fetch and stat.size <= storage.read_cache.max_object_size:
+            return len(storage._fetch(name))
+        return 0
+
+    result = WarmUpResult()
+    names = iter(names)
+    while True:
+        batch = list(itertools.islice(names, batch_size))
+        if not batch:
+            break
+        for name, size, exc in parallel_map(
+                load, batch, workers or storage.MAX_PARALLEL_REQUESTS):
+            result.names += 1
+            if exc is None:
+                result.bytes += size
+            elif isinstance(exc, BaseError):
+                result.failed += 1
+                logger.debug('Failed to warm up "%s": %r', name, exc)
+            else:
+                raise exc
+        if progress is not None:
+            progress(result)
+
+    result.finished = time.time()
+    return result
@@ -1,6 +1,25 @@
 from __future__ import with_statement
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
 from django.test import TestCase
-from django_elliptics import storage
+from django.test.client import RequestFactory
+from django_elliptics import storage, views
+from django_elliptics.cache import EllipticsCache
+from django_elliptics.middleware import EllipticsProfilingMiddleware
+from django_elliptics.storage import profiling
+from django_elliptics.storage.groups import GroupSelector
+from django_elliptics.storage.index import KeyIndex
+from django_elliptics.storage.journal import WriteJournal
+from django_elliptics.storage.packing import PackedStore
+from django_elliptics.storage.readcache import DiskReadCache
+from django_elliptics.storage.singleflight import SingleFlight
 
 class EllipticsStorageTest (TestCase):
     prefix = ''
@@ -65,6 +84,112 @@ class EllipticsStorageTest (TestCase):
         self.storage.delete('test.xml')
         self.assertFalse(self.storage.exists('test.xml'))
 
+    def test_size(self):
+        self.storage.save('test.xml', self.sample1)
+        self.assertEquals(self.storage.size('test.xml'), len(self.sample1))
+
+        with self.storage.open('test.xml', 'r') as stream:
+            self.assertEquals(stream.size, len(self.sample1))
+
+        with self.storage.open('test.xml', 'w') as stream:
+            stream.write(self.sample2)
+        self.assertEquals(self.storage.size('test.xml'), len(self.sample2))
+
+    def test_append_size(self):
+        with self.storage.open('test.xml', 'a') as stream:
+            self.assertEquals(stream.size, 0)
+            stream.write(self.sample1)
+            self.assertEquals(stream.size, len(self.sample1))
+
+    def test_stale_stat(self):
+        self.storage.save('test.xml', self.sample1)
+        stamp = self.storage.metadata_cache.stamp()
+        self.storage.metadata_cache.delete('test.xml')
+        self.storage.metadata_cache.set('test.xml', 'stale', stamp=stamp)
+        self.assertEquals(self.storage.metadata_cache.get('test.xml'), None)
+
+    def test_stat_many(self):
+        self.storage.save('test.xml', self.sample1)
+        stats = self.storage.stat_many(['test.xml', 'missing.xml'])
+        self.assertEquals(stats.keys(), ['test.xml'])
+        self.assertEquals(stats['test.xml'].size, len(self.sample1))
+
+    def test_stat_many_error(self):
+        def fail(name, fresh=False):
+            raise storage.ReadError(HttpResponse(status=503))
+
+        # only a 404 means the name is missing
+        self.storage._stat_unpacked = fail
+        self.assertRaises(
+            storage.ReadError, self.storage.stat_many, ['test.xml']
+        )
+
+    def test_save_unknown_size(self):
+        class Stream(object):
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, num_bytes):
+                chunk, self.data = self.data[:num_bytes], self.data[num_bytes:]
+                return chunk
+
+        self.storage.MAX_CHUNK_SIZE = 8
+        self.storage._save('test.xml', Stream(self.sample2))
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample2)
+
+        # overwrites, not appends
+        self.storage._save('test.xml', Stream(self.sample1))
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+
+    def test_appender(self):
+        self.storage.save('test.xml', self.sample1)
+        with self.storage.appender(max_size=1024, interval=0) as appender:
+            for _ in xrange(3):
+                appender.append('test.xml', self.sample2)
+            self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2 * 3
+        )
+
+    def test_appender_error(self):
+        self.storage.save('test.xml', self.sample1)
+        appender = self.storage.appender(max_size=1024, interval=0)
+        appender.append('test.xml', self.sample2)
+        buffer = appender._buffers['test.xml']
+        buffer.error = storage.BaseError('background flush failed')
+
+        # the failed append does not take the data, its retry does
+        self.assertRaises(
+            storage.BaseError, appender.append, 'test.xml', self.sample2
+        )
+        appender.append('test.xml', self.sample2)
+        appender.close()
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2 * 2
+        )
+        self.assertEquals(appender._buffers, {})
+
+    def test_appender_full_error(self):
+        self.storage.save('test.xml', self.sample1)
+        appender = self.storage.appender(max_size=1, interval=0)
+        save = self.storage._save
+
+        def fail(*args, **kwargs):
+            raise storage.SaveError(HttpResponse(status=500))
+
+        self.storage._save = fail
+        try:
+            # taken, so not raised
+            appender.append('test.xml', self.sample2)
+        finally:
+            del self.storage._save
+        self.assertRaises(storage.SaveError, appender.flush)
+        appender.close()
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2
+        )
+
 
 class PrefixTest (EllipticsStorageTest):
     prefix = 'prefix'
@@ -77,3 +202,565 @@ class LongPrefixTest (EllipticsStorageTest):
 class TimeoutAwareEllipticsStorageTest(EllipticsStorageTest):
     prefix = ''
     storage_class_name = 'TimeoutAwareEllipticsStorage'
+
+
+class JournalTest(EllipticsStorageTest):
+    def setUp(self):
+        super(JournalTest, self).setUp()
+        self.journal_path = tempfile.mkdtemp()
+        self.storage.journal = WriteJournal(self.storage, self.journal_path, 0)
+
+    def tearDown(self):
+        super(JournalTest, self).tearDown()
+        self.wait_for_replay('test.xml')
+        shutil.rmtree(self.journal_path)
+
+    def wait_for_replay(self, name):
+        for _ in xrange(100):
+            if not self.storage.journal.records(name):
+                return
+            time.sleep(0.05)
+        self.fail('journal has not been replayed')
+
+    def test_replay(self):
+        self.storage.save('test.xml', self.sample1)
+        with self.storage.open('test.xml', 'a') as stream:
+            stream.write(self.sample2)
+        self.wait_for_replay('test.xml')
+        self.assertEquals(
+            self.storage._fetch_remote('test.xml'), self.sample1 + self.sample2
+        )
+
+    def test_read_while_replaying(self):
+        journal = self.storage.journal
+        send = journal._send
+        released = threading.Event()
+        journal._send = lambda record: (released.wait(), send(record))
+        try:
+            self.storage.save('test.xml', self.sample1)
+            # appends to a missing name create it
+            with self.storage.open('new.xml', 'a') as stream:
+                stream.write(self.sample2)
+            # replay of test.xml does not hold reads of new.xml
+            self.assertEquals(self.storage._fetch('new.xml'), self.sample2)
+            self.assertEquals(self.storage.size('new.xml'), len(self.sample2))
+        finally:
+            released.set()
+            self.wait_for_replay('new.xml')
+            self.storage.delete('new.xml')
+
+    def test_rejected(self):
+        journal = self.storage.journal
+        send = journal._send
+
+        def reject(record):
+            if record.name == 'bad.xml':
+                raise storage.SaveError(HttpResponse(status=400))
+            return send(record)
+
+        journal._send = reject
+        self.storage.save('bad.xml', self.sample1)
+        self.storage.save('test.xml', self.sample2)
+        # the rejected write does not hold the next one
+        self.wait_for_replay('test.xml')
+        self.wait_for_replay('bad.xml')
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample2)
+
+        rejected = os.path.join(journal.path, 'rejected')
+        with open(os.path.join(rejected, os.listdir(rejected)[0])) as stream:
+            self.assertEquals(stream.read(), 'write bad.xml\n' + self.sample1)
+
+    def test_rotation(self):
+        journal = self.storage.journal
+        journal.segment_size = 1
+        self.storage.save('test.xml', self.sample1)
+        with self.storage.open('test.xml', 'a') as stream:
+            stream.write(self.sample2)
+        self.wait_for_replay('test.xml')
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2
+        )
+        for _ in xrange(100):
+            segments = [
+                filename for filename in os.listdir(journal.path)
+                if filename.endswith('.journal')
+            ]
+            if len(segments) == 1:
+                break
+            time.sleep(0.05)
+        self.assertEquals(len(segments), 1)
+
+    def test_concurrent_start(self):
+        def replayers():
+            return len([
+                thread for thread in threading.enumerate()
+                if thread.name == 'elliptics-journal-replayer'
+            ])
+
+        journal = WriteJournal(self.storage, self.journal_path + '/other', 0)
+        before = replayers()
+        threads = [threading.Thread(target=journal._start) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(replayers() - before, 1)
+
+
+class IndexTest(EllipticsStorageTest):
+    def setUp(self):
+        super(IndexTest, self).setUp()
+        self.index_path = tempfile.mkdtemp()
+        self.storage.index = KeyIndex(self.index_path + '/index.db', self.prefix)
+
+    def tearDown(self):
+        super(IndexTest, self).tearDown()
+        shutil.rmtree(self.index_path)
+
+    def test_listdir(self):
+        self.storage.save('test.xml', self.sample1)
+        self.storage.save('dir/test.xml', self.sample2)
+        try:
+            self.assertEquals(self.storage.listdir(''), (['dir'], ['test.xml']))
+            self.assertEquals(self.storage.listdir('dir'), ([], ['test.xml']))
+            self.assertEquals(
+                list(self.storage.scan('dir/'))[0][:2],
+                ('dir/test.xml', len(self.sample2))
+            )
+        finally:
+            self.storage.delete('dir/test.xml')
+        self.assertEquals(self.storage.listdir('dir'), ([], []))
+
+    def test_listdir_non_ascii(self):
+        directory = u'\u0444\u043e\u0442\u043e'
+        name = directory.encode('utf-8') + '/test.xml'
+        self.storage.save(name, self.sample1)
+        try:
+            self.assertEquals(
+                self.storage.listdir(directory.encode('utf-8')),
+                ([], [u'test.xml'])
+            )
+            self.assertEquals(self.storage.listdir(''), ([directory], []))
+        finally:
+            self.storage.delete(name)
+
+    def test_rebuild(self):
+        self.storage.save('test.xml', self.sample1)
+        self.storage.index.rebuild([('other.xml', 1, 0)], replace=False)
+        self.assertEquals(self.storage.index.get('other.xml'), (1, 0))
+        self.assertEquals(
+            self.storage.index.get('test.xml')[0], len(self.sample1)
+        )
+        self.storage.index.rebuild([('other.xml', 2, 0)])
+        self.assertEquals(self.storage.index.get('other.xml'), (2, 0))
+        self.assertEquals(self.storage.index.get('test.xml'), None)
+
+
+class ReadCacheTest(EllipticsStorageTest):
+    def setUp(self):
+        super(ReadCacheTest, self).setUp()
+        self.cache_path = tempfile.mkdtemp()
+        self.storage.read_cache = DiskReadCache(
+            self.cache_path, self.prefix, 1024, 1024 * 1024
+        )
+
+    def tearDown(self):
+        super(ReadCacheTest, self).tearDown()
+        shutil.rmtree(self.cache_path)
+
+    def test_revalidate(self):
+        self.storage.save('test.xml', self.sample1)
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+
+        # a copy which is still valid is not downloaded again
+        validators, _ = self.storage.read_cache.get('test.xml')
+        with open(self.storage.read_cache._path('test.xml'), 'wb') as stream:
+            stream.write('%s\ncached' % json.dumps(validators))
+        self.assertEquals(self.storage._fetch('test.xml'), 'cached')
+
+        with self.storage.open('test.xml', 'w') as stream:
+            stream.write(self.sample2)
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample2)
+
+
+class ChecksumTest(EllipticsStorageTest):
+    def setUp(self):
+        super(ChecksumTest, self).setUp()
+        self.storage.CHECKSUM = 'sha256'
+        self.storage.MAX_CHUNK_SIZE = 8
+
+    def test_verify(self):
+        self.storage.save('test.xml', self.sample1)
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+        self.assertEquals(
+            ''.join(self.storage.iter_content('test.xml')), self.sample1
+        )
+
+        # change the content behind the manifest, as if it were corrupted
+        manifest = self.storage._fetch_manifest(
+            'test.xml', self.storage.stat('test.xml', fresh=True)
+        )
+        corrupted = self.sample1.replace('test', 'TEST')
+        self.storage._save_file('test.xml', corrupted, len(corrupted))
+        self.storage._store_manifest('test.xml', manifest)
+        self.assertRaises(storage.ChecksumError, self.storage._fetch, 'test.xml')
+        self.assertRaises(
+            storage.ChecksumError, list, self.storage.iter_content('test.xml')
+        )
+
+    def test_concurrent_write(self):
+        self.storage.save('test.xml', self.sample1)
+        manifest = self.storage._fetch_manifest(
+            'test.xml', self.storage.stat('test.xml', fresh=True)
+        )
+        # another writer has replaced the entity before the manifest is stored
+        self.storage._save_file('test.xml', self.sample2, len(self.sample2))
+        self.storage._delete_manifest('test.xml')
+        self.storage._store_manifest('test.xml', manifest)
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample2)
+
+    def test_written_without_checksums(self):
+        self.storage.save('test.xml', self.sample1)
+        self.storage.CHECKSUM = None
+        with self.storage.open('test.xml', 'a') as stream:
+            stream.write('tail')
+        self.storage.CHECKSUM = 'sha256'
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1 + 'tail')
+
+        self.storage.CHECKSUM = None
+        with self.storage.open('test.xml', 'w') as stream:
+            stream.write(self.sample2)
+        self.storage.CHECKSUM = 'sha256'
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample2)
+        self.assertEquals(
+            ''.join(self.storage.iter_content('test.xml')), self.sample2
+        )
+
+
+class PackingTest(EllipticsStorageTest):
+    def setUp(self):
+        super(PackingTest, self).setUp()
+        self.storage.packs = PackedStore(self.storage, 1024, 64 * 1024, 0)
+
+    def test_packed(self):
+        self.storage.packs.put_many([
+            ('test.xml', self.sample1), ('other.xml', self.sample2)
+        ])
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+        self.assertEquals(self.storage._fetch('other.xml'), self.sample2)
+        self.assertEquals(self.storage.size('other.xml'), len(self.sample2))
+        self.assertTrue(self.storage.exists('other.xml'))
+
+        with self.storage.open('test.xml', 'a') as stream:
+            stream.write(self.sample2)
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2
+        )
+
+        self.storage.delete('other.xml')
+        self.assertFalse(self.storage.exists('other.xml'))
+        self.assertEquals(self.storage.packs.compact(1, -1), 2)
+        self.assertEquals(
+            self.storage._fetch('test.xml'), self.sample1 + self.sample2
+        )
+
+    def test_get_while_compacting(self):
+        self.storage.packs.put_many([('test.xml', self.sample1)])
+        stale = [self.storage.packs._entry('test.xml')]
+        self.assertEquals(self.storage.packs.compact(1, -1), 1)
+
+        # the entry was looked up before compact() removed its pack
+        lookup = self.storage.packs._entry
+        self.storage.packs._entry = (
+            lambda name: stale.pop() if stale else lookup(name)
+        )
+        self.assertEquals(self.storage.packs.get('test.xml'), self.sample1)
+
+    def test_pack_names(self):
+        # names of packs are never looked up in the database
+        self.assertNumQueries(0, self.storage.packs.get, '.packs/pack')
+        self.assertNumQueries(
+            0, self.storage.packs.stat_many, ['.packs/pack']
+        )
+
+
+class CacheTest(TestCase):
+    def setUp(self):
+        self.cache = EllipticsCache('cache', {'TIMEOUT': 60})
+
+    def tearDown(self):
+        self.cache.delete_many(['a', 'b', 'c'])
+
+    def test_shared_prefix(self):
+        # clear() would remove the media
+        self.assertRaises(ImproperlyConfigured, EllipticsCache, '', {})
+
+    def test_get_set(self):
+        self.assertEquals(self.cache.get('a', 'default'), 'default')
+        self.cache.set('a', {'value': 1})
+        self.assertEquals(self.cache.get('a'), {'value': 1})
+        self.cache.delete('a')
+        self.assertEquals(self.cache.get('a'), None)
+
+    def test_many(self):
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEquals(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]}
+        )
+
+    def test_expired(self):
+        self.cache.set('a', 1, timeout=0.1)
+        self.assertEquals(self.cache.get('a'), 1)
+        self.cache._l1.clear()
+        time.sleep(0.2)
+        self.assertEquals(self.cache.get('a'), None)
+
+
+class WarmUpTest(TestCase):
+    def setUp(self):
+        self.storage = storage.EllipticsStorage()
+        self.cache_path = tempfile.mkdtemp()
+        self.storage.read_cache = DiskReadCache(
+            self.cache_path, '', 1024, 1024 * 1024
+        )
+        self.sample = '<xml>test data</xml>'
+        self.storage.save('test.xml', self.sample)
+        self.storage.metadata_cache.clear()
+
+    def tearDown(self):
+        self.storage.delete('test.xml')
+        shutil.rmtree(self.cache_path)
+
+    def test_warm_up(self):
+        progress = []
+        result = self.storage.warm_up(
+            ['test.xml', 'missing.xml'], rate=100, progress=progress.append
+        )
+        self.assertEquals((result.names, result.failed), (2, 1))
+        self.assertEquals(result.bytes, len(self.sample))
+        self.assertEquals(progress, [result])
+        self.assertEquals(
+            self.storage.metadata_cache.get('test.xml').size, len(self.sample)
+        )
+        self.assertEquals(
+            self.storage.read_cache.get('test.xml')[1], self.sample
+        )
+
+    def test_metadata_only(self):
+        result = self.storage.warm_up(['test.xml'], content=False)
+        self.assertEquals(result.bytes, 0)
+        self.assertEquals(self.storage.read_cache.get('test.xml'), None)
+
+
+class GroupSelectorTest(TestCase):
+    def test_order(self):
+        selector = GroupSelector([1, 2, 3])
+        selector.report(1, 0.5, True)
+        selector.report(2, 0.1, True)
+        # not measured yet groups go first
+        self.assertEquals(selector.order(), [3, 2, 1])
+
+        selector.report(3, 0.2, True)
+        self.assertEquals(selector.order(), [2, 3, 1])
+
+        for _ in xrange(5):
+            selector.report(2, 0.1, False)
+        self.assertEquals(selector.order(), [3, 1, 2])
+
+
+class ReadGroupsTest(EllipticsStorageTest):
+    def setUp(self):
+        super(ReadGroupsTest, self).setUp()
+        self.storage.read_groups = GroupSelector([1, 2])
+
+    def test_stats(self):
+        self.storage.save('test.xml', self.sample1)
+        self.assertEquals(self.storage._fetch('test.xml'), self.sample1)
+        latency, error_rate = self.storage.read_groups.stats()[1]
+        self.assertTrue(latency > 0)
+        self.assertEquals(error_rate, 0)
+
+    def test_missing(self):
+        urls = []
+        request = self.storage._timeout_request
+
+        def record(method, url, *args, **kwargs):
+            urls.append(url)
+            return request(method, url, *args, **kwargs)
+
+        # a 404 is not looked for group by group
+        self.storage._timeout_request = record
+        self.assertRaises(storage.ReadError, self.storage._fetch, 'missing.xml')
+        self.assertEquals(len(urls), 2)
+        self.assertTrue('groups=' in urls[0])
+        self.assertFalse('groups=' in urls[1])
+
+
+class SingleFlightTest(TestCase):
+    def test_shared_call(self):
+        flights = SingleFlight()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'content'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                flights.do(('test.xml', 'GET'), fetch)))
+            for _ in xrange(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(results, ['content'] * 5)
+
+    def test_shared_error(self):
+        flights = SingleFlight()
+
+        def fetch():
+            raise storage.NotFoundError('test.xml')
+
+        self.assertRaises(
+            storage.NotFoundError, flights.do, ('test.xml', 'GET'), fetch
+        )
+        # a failed call is not remembered
+        self.assertEquals(flights.do(('test.xml', 'GET'), lambda: 1), 1)
+
+
+    def test_read_during_write(self):
+        elliptics = storage.EllipticsStorage()
+        elliptics.save('test.xml', 'old')
+        get, save_file = elliptics._get, elliptics._save_file
+
+        def slow_get(name):
+            content = get(name)
+            time.sleep(0.3)
+            return content
+
+        def save_file_with_reader(*args, **kwargs):
+            # the reader has got the old content and is still in flight
+            reader.start()
+            time.sleep(0.1)
+            return save_file(*args, **kwargs)
+
+        elliptics._get = slow_get
+        elliptics._save_file = save_file_with_reader
+        reader = threading.Thread(target=elliptics._fetch, args=('test.xml',))
+        try:
+            elliptics._save('test.xml', 'new')
+            self.assertEquals(elliptics._fetch('test.xml'), 'new')
+        finally:
+            reader.join()
+            elliptics.delete('test.xml')
+
+
+class MetadataTest(TestCase):
+    def test_stat_during_write(self):
+        elliptics = storage.EllipticsStorage()
+        elliptics.save('test.xml', 'old')
+        save_file = elliptics._save_file
+
+        def save_file_with_stat(*args, **kwargs):
+            # a HEAD answered with the old size during the upload
+            elliptics.stat('test.xml')
+            return save_file(*args, **kwargs)
+
+        elliptics._save_file = save_file_with_stat
+        try:
+            elliptics._save('test.xml', 'new content')
+            self.assertEquals(elliptics.size('test.xml'), len('new content'))
+        finally:
+            elliptics.delete('test.xml')
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        self.storage = storage.EllipticsStorage(prefix='prefix')
+
+    def tearDown(self):
+        self.storage.delete('test.xml')
+
+    def test_trace(self):
+        middleware = EllipticsProfilingMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        self.storage.save('test.xml', '0123456789')
+        self.storage._fetch('test.xml')
+        response = middleware.process_response(request, HttpResponse())
+
+        calls = request.elliptics_trace.calls
+        self.assertEquals(
+            [(call.method, call.key) for call in calls][-2:],
+            [('POST', 'prefix/test.xml'), ('GET', 'prefix/test.xml')]
+        )
+        self.assertEquals(calls[-1].bytes, 10)
+        self.assertTrue(response['Server-Timing'].startswith('elliptics;'))
+        self.assertEquals(profiling.current(), None)
+
+
+class ServeTest(TestCase):
+    def setUp(self):
+        self.storage = storage.EllipticsStorage()
+        self.storage.save('test.xml', '0123456789')
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.storage.delete('test.xml')
+
+    def serve(self, **headers):
+        request = self.factory.get('/test.xml', **headers)
+        return views.serve(request, 'test.xml', self.storage)
+
+    def test_full(self):
+        response = self.serve()
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(''.join(response), '0123456789')
+
+    def test_range(self):
+        response = self.serve(HTTP_RANGE='bytes=2-4')
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEquals(''.join(response), '234')
+
+        response = self.serve(HTTP_RANGE='bytes=-3')
+        self.assertEquals(''.join(response), '789')
+
+        self.assertEquals(self.serve(HTTP_RANGE='bytes=10-').status_code, 416)
+
+        # an invalid range is ignored
+        response = self.serve(HTTP_RANGE='bytes=5-2')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(''.join(response), '0123456789')
+
+    def test_unknown_size(self):
+        # Elliptics has not sent Content-Length
+        self.storage.stat = (
+            lambda name, fresh=False: storage.base.ObjectStat(None, None, None)
+        )
+        self.storage.MAX_CHUNK_SIZE = 4
+        response = self.serve(HTTP_RANGE='bytes=2-4')
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEquals(''.join(response), '0123456789')
+
+    def test_stale_metadata(self):
+        # as if another process has overwritten the entity
+        self.storage.metadata_cache.set(
+            'test.xml', storage.base.ObjectStat(4, None, None)
+        )
+        response = self.serve()
+        self.assertEquals(response['Content-Length'], '10')
+        self.assertEquals(''.join(response), '0123456789')
+
+    def test_accel_redirect(self):
+        request = self.factory.get('/test.xml')
+        response = views.serve(
+            request, 'test.xml', self.storage, accel_redirect='/internal/'
+        )
+        self.assertEquals(response['X-Accel-Redirect'], '/internal/test.xml')
@@ -0,0 +1,132 @@
+# coding: utf-8
+import mimetypes
+import re
+
+from django import http
+
+from django_elliptics.models import STORAGE
+from django_elliptics.storage.errors import ReadError
+from django_elliptics.storage.settings import ELLIPTICS_ACCEL_REDIRECT_PREFIX
+
+# available since Django 1.5, plain HttpResponse streams iterators before it
+StreamingHttpResponse = getattr(
+    http, 'StreamingHttpResponse', http.HttpResponse
+)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested range is outside of the entity."""
+
+
+def parse_range(header, size):
+    """
+    Return (first, last) byte positions requested by the Range header.
+
+    Only a single valid range is supported, None is returned for anything
+    else, which means the whole entity should be sent (RFC 7233 ignores an
+    invalid Range header).
+
+    @raise: RangeNotSatisfiable
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # the last N bytes
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        last = min(int(last), size - 1) if last else size - 1
+
+    if first > last or first >= size:
+        raise RangeNotSatisfiable(header)
+    return first, last
+
+
+def streaming_response(request, name, storage=None, content_type=None,
+                       accel_redirect=ELLIPTICS_ACCEL_REDIRECT_PREFIX):
+    """
+    Return a response with the content of the name.
+
+    With accel_redirect the response only has X-Accel-Redirect header
+    pointing to accel_redirect + name, nginx transfers the content itself
+    and the worker is free at once. Otherwise the content is streamed in
+    chunks from the private Elliptics URL, Range requests are supported.
+
+    @raise: Http404
+    """
+    storage = storage or STORAGE
+    if content_type is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    if accel_redirect:
+        response = http.HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = '/' + storage._make_url(
+            accel_redirect, storage.settings.prefix, name
+        )
+        return response
+
+    try:
+        # a cached size may be stale after writes of other processes,
+        # the body would not match Content-Length then
+        size = storage.stat(name, fresh=True).size
+    except ReadError:
+        raise http.Http404(name)
+
+    if size is None:
+        # without Content-Length from Elliptics ranges can not be served,
+        # the whole entity is sent without a length
+        content = ''
+        if request.method != 'HEAD':
+            content = storage.iter_content(name)
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    try:
+        requested = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        response = http.HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    if requested is None:
+        first, last, status = 0, size - 1, 200
+    else:
+        first, last = requested
+        status = 206
+
+    length = last - first + 1
+    if request.method == 'HEAD' or not length:
+        content = ''
+    else:
+        content = storage.iter_content(name, first, length)
+
+    response = StreamingHttpResponse(
+        content, status=status, content_type=content_type
+    )
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Length'] = str(length)
+    if status == 206:
+        response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+    return response
+
+
+def serve(request, name, storage=None, content_type=None,
+          accel_redirect=ELLIPTICS_ACCEL_REDIRECT_PREFIX):
+    """
+    Django view sending the entity. Wrap it in your own view to check access.
+
+    url(r'^media/(?P<name>.+)$', 'django_elliptics.views.serve')
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return http.HttpResponseNotAllowed(['GET', 'HEAD'])
+    return streaming_response(
+        request, name, storage, content_type, accel_redirect
+    )